@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+import http_client
+
+# Variáveis de Ambiente
+TENANT_ID = os.getenv("TENANT_ID")
+CLIENT_ID = os.getenv("CLIENT_ID")
+CLIENT_SECRET = os.getenv("CLIENT_SECRET")
+
+# Azure AD token endpoint
+TOKEN_URL = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/token"
+
+# Recursos para os quais os tokens são emitidos
+ARM_RESOURCE = "https://management.azure.com/"
+LOG_ANALYTICS_RESOURCE = "https://api.loganalytics.io/"
+STORAGE_RESOURCE = "https://storage.azure.com/"
+
+# Antecedência (segundos) com que um token é renovado antes de expirar
+TOKEN_REFRESH_MARGIN = int(os.getenv("TOKEN_REFRESH_MARGIN", "300"))
+
+# Cache de tokens por recurso: resource -> (access_token, expires_on)
+# Fica no nível do módulo para ser reaproveitado entre invocações do mesmo worker
+_tokens = {}
+_locks = {}
+_locks_guard = threading.Lock()
+
+def _token_valido(cached):
+    return cached is not None and cached[1] - TOKEN_REFRESH_MARGIN > time.time()
+
+def _lock_do_recurso(resource):
+    with _locks_guard:
+        return _locks.setdefault(resource, threading.Lock())
+
+def _obter_token_com_expiracao(resource):
+    cached = _tokens.get(resource)
+    if _token_valido(cached):
+        return cached
+
+    # Apenas uma thread por recurso busca um novo token; as demais aguardam
+    # e reaproveitam o token obtido
+    with _lock_do_recurso(resource):
+        cached = _tokens.get(resource)
+        if _token_valido(cached):
+            return cached
+
+        payload = {
+            'grant_type': 'client_credentials',
+            'client_id': CLIENT_ID,
+            'client_secret': CLIENT_SECRET,
+            'resource': resource
+        }
+        response = http_client.post(TOKEN_URL, data=payload)
+        response.raise_for_status()
+        data = response.json()
+
+        if data.get("expires_on"):
+            expires_on = int(data["expires_on"])
+        else:
+            expires_on = int(time.time()) + int(data.get("expires_in", 3599))
+
+        cached = (data['access_token'], expires_on)
+        _tokens[resource] = cached
+        return cached
+
+def get_token(resource):
+    """
+    Obtém um access token para o recurso informado, reaproveitando o token em cache
+    enquanto ele estiver válido
+    
+    Args:
+        resource (str): Recurso do token (ARM_RESOURCE, LOG_ANALYTICS_RESOURCE, STORAGE_RESOURCE)
+    
+    Returns:
+        str: Access token
+    """
+    return _obter_token_com_expiracao(resource)[0]
+
+class CachedTokenCredential:
+    """Credencial para os clientes do Azure SDK que usa o mesmo cache de tokens deste módulo"""
+
+    def get_token(self, *scopes, **kwargs):
+        from azure.core.credentials import AccessToken
+
+        # O SDK pede escopos no formato "<recurso>/.default"
+        resource = scopes[0].removesuffix(".default")
+        token, expires_on = _obter_token_com_expiracao(resource)
+        return AccessToken(token, expires_on)
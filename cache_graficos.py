@@ -0,0 +1,100 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+# Quantidade de gráficos mantidos em memória por worker
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", "32"))
+
+# Diretório opcional para persistir os gráficos entre reinícios do worker
+CHART_CACHE_DIR = os.getenv("CHART_CACHE_DIR")
+
+# Incrementar sempre que a aparência dos gráficos mudar, para invalidar o cache
+VERSAO_RENDERIZACAO = 3
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def serie_de_entidades(entidades):
+    """Extrai a série (data, score) usada como entrada dos gráficos"""
+    return [(e["RowKey"], e["Score"]) for e in entidades]
+
+def chave_grafico(nome, dados, **parametros):
+    """
+    Calcula a chave do cache a partir dos dados de entrada e dos parâmetros de renderização
+    
+    Args:
+        nome (str): Identificador do gráfico
+        dados: Séries de entrada (qualquer estrutura serializável em JSON)
+        **parametros: Demais parâmetros que alteram a imagem
+    
+    Returns:
+        str: Hash SHA-256 em hexadecimal
+    """
+    conteudo = json.dumps(
+        {"nome": nome, "versao": VERSAO_RENDERIZACAO, "dados": dados, "parametros": parametros},
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+def _ler_disco(chave):
+    caminho = os.path.join(CHART_CACHE_DIR, f"{chave}.json")
+    try:
+        with open(caminho, "r", encoding="utf-8") as arquivo:
+            return json.load(arquivo)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning(f"Cache de gráficos em disco ilegível ({caminho}): {e}")
+        return None
+
+def _gravar_disco(chave, valor):
+    caminho = os.path.join(CHART_CACHE_DIR, f"{chave}.json")
+    temporario = f"{caminho}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(CHART_CACHE_DIR, exist_ok=True)
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            json.dump(valor, arquivo)
+        os.replace(temporario, caminho)
+    except OSError as e:
+        logging.warning(f"Não foi possível gravar o cache de gráficos em disco ({caminho}): {e}")
+
+def _guardar_memoria(chave, valor):
+    with _cache_lock:
+        _cache[chave] = valor
+        _cache.move_to_end(chave)
+        while len(_cache) > CHART_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+def obter_ou_gerar(chave, gerar):
+    """
+    Retorna o gráfico em cache ou o gera com a função informada
+    Procura primeiro na memória (LRU) e depois no disco, se CHART_CACHE_DIR estiver definido.
+    Resultados vazios (None) não são guardados.
+    
+    Args:
+        chave (str): Chave calculada com chave_grafico
+        gerar (callable): Função sem argumentos que renderiza o gráfico
+    
+    Returns:
+        Valor retornado por gerar (serializável em JSON)
+    """
+    with _cache_lock:
+        if chave in _cache:
+            _cache.move_to_end(chave)
+            return _cache[chave]
+
+    if CHART_CACHE_DIR:
+        valor = _ler_disco(chave)
+        if valor is not None:
+            _guardar_memoria(chave, valor)
+            return valor
+
+    valor = gerar()
+    if valor is not None:
+        _guardar_memoria(chave, valor)
+        if CHART_CACHE_DIR:
+            _gravar_disco(chave, valor)
+    return valor
@@ -0,0 +1,71 @@
+"""
+Mede o tempo de import do Function App (cold start) e verifica o orçamento
+
+Uso:
+    python cold_start_budget.py
+    python -m pytest test   (executa a mesma verificação em test/test_cold_start.py)
+
+Executa "python -X importtime -c 'import function_app'" em um processo novo,
+mostra os módulos de topo mais lentos e termina com código 1 se o tempo total
+passar de COLD_START_BUDGET_MS ou se algum módulo pesado for carregado no import.
+"""
+import os
+import re
+import subprocess
+import sys
+
+# Orçamento (em milissegundos) para importar o function_app
+COLD_START_BUDGET_MS = int(os.getenv("COLD_START_BUDGET_MS", "1000"))
+
+# Módulos que só devem ser carregados nos caminhos que os utilizam
+MODULOS_PROIBIDOS = ["matplotlib", "jinja2", "azure.data.tables", "azure.storage.blob", "grafico_score", "mini_graficos_score"]
+
+LINHA_IMPORTTIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)")
+
+def medir_imports(modulo="function_app"):
+    """
+    Importa o módulo em um processo novo com -X importtime
+    
+    Returns:
+        list: (nome do módulo, profundidade, tempo acumulado em ms) na ordem do import
+    """
+    diretorio = os.path.dirname(os.path.abspath(__file__))
+    processo = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=diretorio, capture_output=True, text=True, check=True
+    )
+
+    medicoes = []
+    for linha in processo.stderr.splitlines():
+        encontrado = LINHA_IMPORTTIME.match(linha)
+        if encontrado:
+            acumulado_us, indentacao, nome = int(encontrado.group(2)), encontrado.group(3), encontrado.group(4)
+            medicoes.append((nome, len(indentacao) // 2, acumulado_us / 1000))
+    return medicoes
+
+def main():
+    medicoes = medir_imports()
+    total_ms = sum(m[2] for m in medicoes if m[1] == 0)
+
+    # Detalhamento pelos imports feitos diretamente pelo function_app e seus vizinhos
+    detalhamento = sorted((m for m in medicoes if m[1] == 1), key=lambda m: m[2], reverse=True)
+
+    print(f"Tempo total de import: {total_ms:.1f} ms (orçamento: {COLD_START_BUDGET_MS} ms)")
+    for nome, _, acumulado_ms in detalhamento[:15]:
+        print(f"  {acumulado_ms:8.1f} ms  {nome}")
+
+    carregados = {m[0] for m in medicoes}
+    proibidos = [p for p in MODULOS_PROIBIDOS if p in carregados]
+
+    erros = []
+    if total_ms > COLD_START_BUDGET_MS:
+        erros.append(f"Import excedeu o orçamento: {total_ms:.1f} ms > {COLD_START_BUDGET_MS} ms")
+    if proibidos:
+        erros.append(f"Módulos pesados carregados no import: {', '.join(proibidos)}")
+
+    for erro in erros:
+        print(erro, file=sys.stderr)
+    return 1 if erros else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import functools
+import logging
+import re
+from datetime import datetime
+import numpy as np
+
+# Formatos aceitos além do ISO 8601, na ordem em que são testados
+FORMATOS_DATA = [
+    "%Y-%m-%dT%H:%M:%S",    # 2025-09-25T00:00:00
+    "%Y-%m-%d",             # 2025-09-25
+    "%Y-%m-%dT%H:%M",       # 2025-09-25T00:00
+    "%d/%m/%Y",             # 25/09/2025
+    "%d-%m-%Y",             # 25-09-2025
+    "%Y/%m/%d",             # 2025/09/25
+]
+
+# Deslocamento de fuso no fim de uma data com hora (ex.: 2025-09-25T10:00:00-03:00)
+FUSO_HORARIO = re.compile(r"T.*[+-]\d{2}:?\d{2}$")
+
+def _normalizar(data):
+    # Datas sem fuso e sem microssegundos, como as gravadas no RowKey
+    # O fuso é descartado (não convertido para UTC): vale o horário escrito
+    return data.replace(tzinfo=None, microsecond=0)
+
+class ParserDatas:
+    """
+    Converte as datas de uma tabela, lembrando o último formato que funcionou
+    Em uma mesma tabela as datas costumam ter um único formato, então as linhas
+    seguintes são convertidas na primeira tentativa
+    """
+
+    def __init__(self):
+        self.formato = None
+
+    def converter(self, valor):
+        """
+        Converte uma data em texto para datetime
+        
+        Returns:
+            datetime: Data convertida, ou None se nenhum formato for reconhecido
+        """
+        if valor is None:
+            return None
+        texto = str(valor).strip()
+
+        # Caminho rápido: ISO 8601, o formato gravado pelo publishScores
+        try:
+            return _normalizar(datetime.fromisoformat(texto))
+        except ValueError:
+            pass
+
+        # Remover o 'Z' e os microssegundos antes de testar os demais formatos
+        if texto.endswith('Z'):
+            texto = texto[:-1]
+        if '.' in texto and 'T' in texto:
+            texto = texto.split('.')[0]
+
+        formatos = FORMATOS_DATA if self.formato is None else [self.formato] + FORMATOS_DATA
+        for formato in formatos:
+            try:
+                data = datetime.strptime(texto, formato)
+            except ValueError:
+                continue
+            self.formato = formato
+            return data
+
+        return None
+
+    def converter_coluna(self, valores):
+        """
+        Converte uma coluna inteira de datas (ex.: todos os RowKeys de uma partição)
+        Tenta primeiro a conversão vetorizada do NumPy para datas ISO e só converte
+        linha a linha se a coluna tiver outros formatos ou datas com fuso, que o
+        NumPy converteria para UTC em vez de descartar o fuso como em converter
+        
+        Returns:
+            tuple: (lista de datetime ou None, índices das linhas não reconhecidas)
+        """
+        valores = list(valores)
+        textos = [str(v).strip().rstrip('Z') for v in valores]
+        if not any(v is None for v in valores) and not any(FUSO_HORARIO.search(t) for t in textos):
+            try:
+                datas = np.array(textos, dtype='datetime64[us]').astype('datetime64[s]').astype(object).tolist()
+                if not any(d is None for d in datas):
+                    return datas, []
+            except ValueError:
+                pass
+
+        datas = [self.converter(valor) for valor in valores]
+        invalidas = [indice for indice, data in enumerate(datas) if data is None]
+        return datas, invalidas
+
+_parser_padrao = ParserDatas()
+
+@functools.lru_cache(maxsize=4096)
+def converter_data(valor):
+    """Converte uma única data em texto para datetime (None se não reconhecida), com cache"""
+    return _parser_padrao.converter(valor)
+
+def converter_coluna(valores):
+    """Converte uma coluna de datas com um parser próprio; ver ParserDatas.converter_coluna"""
+    return ParserDatas().converter_coluna(valores)
+
+def converter_rowkeys(entidades, contexto=""):
+    """
+    Converte os RowKeys (datas) das entidades e descarta as linhas não reconhecidas,
+    registrando no log quais foram ignoradas
+    
+    Returns:
+        tuple: (lista de datetime, entidades correspondentes)
+    """
+    datas, invalidas = converter_coluna([e["RowKey"] for e in entidades])
+    if invalidas:
+        ignoradas = [entidades[indice]["RowKey"] for indice in invalidas]
+        logging.warning(f"{contexto}: {len(ignoradas)} data(s) não reconhecida(s) ignorada(s): {ignoradas[:10]}")
+
+    validas = [(data, e) for data, e in zip(datas, entidades) if data is not None]
+    return [data for data, _ in validas], [e for _, e in validas]
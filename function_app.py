@@ -1,57 +1,113 @@
 import azure.functions as func
 import logging
+import functools
 import os
-import requests
-from grafico_score import gerar_grafico_multicategorias
-from mini_graficos_score import obter_dados_evolucao_todas_categorias
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+import http_client
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from azure_auth import get_token, ARM_RESOURCE, LOG_ANALYTICS_RESOURCE
+from subscriptions import listar_subscriptions, executar_por_subscription, SUBSCRIPTION_IDS, MANAGEMENT_GROUP_ID
+from vencimentos import agrupar_por_vencimento
+from historico_scores import carregar_historico_scores, carregar_estado_scores, nivel_rollup, JANELA_HISTORICO_DIAS
+from snapshots_relatorio import salvar_snapshot, ler_snapshot, listar_snapshots_subscriptions, excluir_snapshot
 #from dotenv import load_dotenv
-from jinja2 import Template
 
 #load_dotenv()
 
-# Variáveis de Ambiente
-TENANT_ID = os.getenv("TENANT_ID")
-CLIENT_ID = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
-SUBSCRIPTION_ID = os.getenv("SUBSCRIPTION_ID")
-
-# Azure AD token endpoint
-TOKEN_URL = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/token"
-
 # Constantes
 ADVISOR_CATEGORIES = ["Security", "Cost", "HighAvailability", "OperationalExcellence", "Performance"]
 
+# Template do relatório
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+REPORT_TEMPLATE = "relatorio.html"
+
+# Número máximo de chamadas simultâneas na coleta do relatório
+REPORT_MAX_WORKERS = int(os.getenv("REPORT_MAX_WORKERS", "8"))
+
+# Tempo máximo (segundos) de espera por fonte de dados do relatório
+REPORT_SOURCE_TIMEOUTS = {
+    "recommendations": int(os.getenv("TIMEOUT_RECOMMENDATIONS", "60")),
+    "service_health": int(os.getenv("TIMEOUT_SERVICE_HEALTH", "30")),
+    "kv_expiration": int(os.getenv("TIMEOUT_LOG_ANALYTICS", "45")),
+    "charts": int(os.getenv("TIMEOUT_GRAFICOS", "90")),
+}
+
+# Agenda (NCRONTAB) da pré-geração dos snapshots do relatório
+REPORT_SNAPSHOT_SCHEDULE = os.getenv("REPORT_SNAPSHOT_SCHEDULE", "0 0 */6 * * *")
+
+# Idade máxima (horas) de um snapshot servido; cerca de 2x o intervalo da agenda.
+# Snapshots mais antigos indicam que o timer está falhando e são regerados
+REPORT_SNAPSHOT_MAX_AGE_HOURS = int(os.getenv("REPORT_SNAPSHOT_MAX_AGE_HOURS", "12"))
+
 # Função para obter o Azure access token
 def get_access_token():
-    payload = {
-        'grant_type': 'client_credentials',
-        'client_id': CLIENT_ID,
-        'client_secret': CLIENT_SECRET,
-        'resource': 'https://management.azure.com/'
-    }
-    response = requests.post(TOKEN_URL, data=payload)
-    response.raise_for_status()
-    return response.json()['access_token']
-     
+    return get_token(ARM_RESOURCE)
 
-# Função para obter recomendações de alto impacto ("High")
-def get_recommendations(token):
-    url = f"https://management.azure.com/subscriptions/{SUBSCRIPTION_ID}/providers/Microsoft.Advisor/recommendations?api-version=2025-01-01"
+# Função para percorrer todas as páginas de recomendações do Advisor
+def iter_advisor_recommendations(token, subscription_id):
+    """
+    Percorre as recomendações do Azure Advisor página a página, seguindo o 'nextLink'
+    Apenas uma página fica em memória por vez, independente do total de recomendações
+    
+    Yields:
+        dict: Cada recomendação retornada pela API
+    """
+    url = f"https://management.azure.com/subscriptions/{subscription_id}/providers/Microsoft.Advisor/recommendations?api-version=2025-01-01"
     headers = {'Authorization': f'Bearer {token}'}
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    data = response.json()
 
+    while url:
+        response = http_client.get(url, headers=headers)
+        response.raise_for_status()
+        page = response.json()
+        url = page.get("nextLink")
+
+        yield from page.get("value", [])
+
+# Função para obter as recomendações do Advisor de uma subscription em uma única chamada
+def get_recommendations(token, subscription_id):
+    """
+    Obtém as recomendações do Azure Advisor uma única vez e monta, na mesma passada:
+    - a lista de recomendações de alto impacto ("High") agrupadas por descrição e categoria
+    - o resumo de quantidades por categoria e impacto, considerando apenas a
+      recomendação mais recente para cada recurso/problema
+    
+    Returns:
+        tuple: (lista de recomendações High, dicionário com contadores por categoria e impacto)
+    """
     # Usar um dicionário para contar recomendações por (descrição, categoria)
     rec_count = {}
-    for item in data.get("value", []):
-        category = item["properties"]["category"]
-        impact = item["properties"]["impact"]
-        if category in ADVISOR_CATEGORIES and impact == "High":
-            description = item["properties"]["shortDescription"]["problem"]
-            key = (description, category)
+
+    # Dicionário para armazenar apenas a recomendação mais recente por chave única
+    latest_recommendations = {}
+
+    for item in iter_advisor_recommendations(token, subscription_id):
+        properties = item["properties"]
+        category = properties["category"]
+        if category not in ADVISOR_CATEGORIES:
+            continue
+
+        impact = properties["impact"]
+        problem = properties["shortDescription"]["problem"]
+
+        if impact == "High":
+            key = (problem, category)
             rec_count[key] = rec_count.get(key, 0) + 1
 
+        # Chave única baseada no recurso afetado e problema
+        resource_id = properties.get("resourceId", "")
+        solution = properties["shortDescription"].get("solution", "")
+        unique_key = f"{category}_{resource_id}_{problem}_{solution}"
+
+        # Obter data da última atualização
+        last_updated = properties.get("lastUpdated", "1900-01-01T00:00:00Z")
+
+        # Se é a primeira vez que vemos esta chave ou se é mais recente
+        latest = latest_recommendations.get(unique_key)
+        if latest is None or last_updated > latest[2]:
+            latest_recommendations[unique_key] = (category, impact, last_updated)
+
     # Construir a lista de recomendações com descrições e contagens únicas
     recommendations = [
         {
@@ -62,66 +118,56 @@ def get_recommendations(token):
         for (desc, cat), count in rec_count.items()
     ]
 
-    return recommendations
+    # Contar apenas as recomendações mais recentes
+    summary = empty_recommendations_summary()
+    for category, impact, _ in latest_recommendations.values():
+        summary[category][impact] += 1
 
-# Função para obter contadores de recomendações por categoria e impacto
-def get_recommendations_summary(token):
+    return recommendations, summary
+
+def empty_recommendations_summary():
+    return {category: {"High": 0, "Medium": 0, "Low": 0} for category in ADVISOR_CATEGORIES}
+
+# Função para obter e consolidar as recomendações de várias subscriptions
+def get_recommendations_all(token, subscriptions):
     """
-    Obtém resumo de quantidades de recomendações por categoria e impacto
-    Considera apenas a recomendação mais recente para cada recurso/problema
+    Busca as recomendações de cada subscription em paralelo e soma os resultados
+    Se nenhuma subscription responder, a fonte falha e fica indisponível no relatório
     
     Returns:
-        dict: Dicionário com contadores por categoria e impacto
+        tuple: (lista de recomendações High consolidada, resumo consolidado por categoria e impacto,
+        subscriptions cujas recomendações não puderam ser obtidas)
     """
-    url = f"https://management.azure.com/subscriptions/{SUBSCRIPTION_ID}/providers/Microsoft.Advisor/recommendations?api-version=2025-01-01"
-    headers = {'Authorization': f'Bearer {token}'}
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    data = response.json()
+    por_subscription, falhas = executar_por_subscription(get_recommendations, subscriptions, token)
+    if falhas and not por_subscription:
+        raise RuntimeError(f"Recomendações indisponíveis em todas as {len(falhas)} subscriptions")
 
-    # Inicializar contadores
-    summary = {}
-    for category in ADVISOR_CATEGORIES:
-        summary[category] = {"High": 0, "Medium": 0, "Low": 0}
+    rec_count = {}
+    summary = empty_recommendations_summary()
+    for recommendations, sub_summary in por_subscription.values():
+        for rec in recommendations:
+            key = (rec["description"], rec["category"])
+            rec_count[key] = rec_count.get(key, 0) + rec["count"]
+        for category, impacts in sub_summary.items():
+            for impact, count in impacts.items():
+                summary[category][impact] += count
 
-    # Dicionário para armazenar apenas a recomendação mais recente por chave única
-    latest_recommendations = {}
-    
-    # Processar todas as recomendações e manter apenas a mais recente de cada
-    for item in data.get("value", []):
-        category = item["properties"]["category"]
-        impact = item["properties"]["impact"]
-        
-        if category in ADVISOR_CATEGORIES:
-            # Criar chave única baseada no recurso afetado e problema
-            resource_id = item["properties"].get("resourceId", "")
-            problem = item["properties"]["shortDescription"]["problem"]
-            solution = item["properties"]["shortDescription"].get("solution", "")
-            
-            # Chave única para identificar recomendações similares
-            unique_key = f"{category}_{resource_id}_{problem}_{solution}"
-            
-            # Obter data da última atualização
-            last_updated = item["properties"].get("lastUpdated", "1900-01-01T00:00:00Z")
-            
-            # Se é a primeira vez que vemos esta chave ou se é mais recente
-            if unique_key not in latest_recommendations or last_updated > latest_recommendations[unique_key]["lastUpdated"]:
-                latest_recommendations[unique_key] = {
-                    "category": category,
-                    "impact": impact,
-                    "lastUpdated": last_updated
-                }
+    recommendations = [
+        {
+            "description": desc,
+            "category": cat,
+            "count": count
+        }
+        for (desc, cat), count in rec_count.items()
+    ]
 
-    # Contar apenas as recomendações mais recentes
-    for rec in latest_recommendations.values():
-        category = rec["category"]
-        impact = rec["impact"]
-        summary[category][impact] += 1
+    return recommendations, summary, falhas
 
-    return summary
+# Quantidade máxima de subscriptions por consulta do Resource Graph
+RESOURCE_GRAPH_MAX_SUBSCRIPTIONS = 1000
 
 #Funtion to get Service health Alerts
-def query_resource_graph(token):
+def query_resource_graph(token, subscriptions):
     url = "https://management.azure.com/providers/Microsoft.ResourceGraph/resources?api-version=2021-03-01"
     headers = {
         'Authorization': f'Bearer {token}',
@@ -142,14 +188,24 @@ def query_resource_graph(token):
     | order by ['count_'] desc
     """
 
-    body = {
-        "query": query,
-        "subscriptions": [SUBSCRIPTION_ID]
-    }
+    # Uma única consulta cobre todas as subscriptions (em lotes do limite da API)
+    result = {}
+    for inicio in range(0, len(subscriptions), RESOURCE_GRAPH_MAX_SUBSCRIPTIONS):
+        body = {
+            "query": query,
+            "subscriptions": subscriptions[inicio:inicio + RESOURCE_GRAPH_MAX_SUBSCRIPTIONS]
+        }
 
-    response = requests.post(url, headers=headers, json=body)
-    response.raise_for_status()
-    result = response.json()
+        response = http_client.post(url, headers=headers, json=body)
+        response.raise_for_status()
+        lote = response.json()
+
+        if not result:
+            result = lote
+        elif isinstance(result.get("data"), list) and isinstance(lote.get("data"), list):
+            result["data"].extend(lote["data"])
+        elif isinstance(result.get("data"), dict) and isinstance(lote.get("data"), dict):
+            result["data"].setdefault("rows", []).extend(lote["data"].get("rows", []))
 
     # Garante que 'data' seja sempre um dicionário com 'columns' e 'rows'
     if isinstance(result.get("data"), list):
@@ -166,56 +222,65 @@ def query_resource_graph(token):
 
     return result
 
-# Função para obter o access token do Log Analytics
-def get_access_law_token():
-    payload = {
-        'grant_type': 'client_credentials',
-        'client_id': CLIENT_ID,
-        'client_secret': CLIENT_SECRET,
-        'resource': 'https://api.loganalytics.io/'
-    }
-    response = requests.post(TOKEN_URL, data=payload)
-    response.raise_for_status()
-    return response.json()['access_token']
+# Função para obter os alertas de Service Health no formato do relatório
+def get_service_health(token, subscriptions):
+    resource_graph_data = query_resource_graph(token, subscriptions)
+    service_health_data = []
 
-# Função para obter informações de certificados do Log Analytics
-def get_kv_certificates_expiration(token):
-    workspace_id = "63ffa334-8ba1-430d-b851-8a0895443ae3"
-    url = f"https://api.loganalytics.azure.com/v1/workspaces/{workspace_id}/query"
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'Content-Type': 'application/json'
-    }
+    data_section = resource_graph_data.get("data", {})
 
-    query = """
-    let ItemNameRegex = @"(?i)https://.+?.vault.azure.net/.+?/(.*)";
-    KVCertificateInfo_CL
-    | summarize arg_max(TimeGenerated, *) by ItemID
-    | where ItemType in ("Certificate")
-    | extend Name = extract(ItemNameRegex, 1, ItemID)
-    | extend HasExpirationDate = iif(Expiration > todatetime("1970-01-01"), true, false)
-    | extend DaysToExpire = iif(HasExpirationDate == true, toint((Expiration - now()) / 1d), -99999)
-    | extend State = iif(DaysToExpire == -99999, "No Expiration", iif(DaysToExpire <= 30, "Critical", iif(DaysToExpire <= 60, "Warning", "Healthy")))
-    | extend Subscription = extract(@"/subscriptions/(.+?)/", 1, KVResourceID)
-    | project State, Subscription, KVResourceID, Name, ItemType, DaysToExpire
-    | top 1000 by DaysToExpire asc
-    """
+    # Verifica se 'data' é um dicionário e contém 'rows'
+    if isinstance(data_section, dict) and "rows" in data_section:
+        rows = data_section["rows"]
+        if rows:
+            for row in rows:
+                service_health_data.append({
+                    "Title": row[0],
+                    "Service": row[1],
+                    "subscriptionId": row[2],
+                    "count_": row[3]
+                })
+        else:
+            service_health_data.append({
+                "Title": "Nenhum incidente encontrado",
+                "Service": "N/A",
+                "subscriptionId": "N/A",
+                "count_": 0
+            })
+    else:
+        # Caso 'data' não seja um dicionário ou não tenha 'rows'
+        service_health_data = service_health_unavailable()
 
-    body = { "query": query }
-    response = requests.post(url, headers=headers, json=body)
-    response.raise_for_status()
-    result = response.json()
+    return service_health_data
 
-    certs = []
-    if "tables" in result and result["tables"]:
-        columns = [col["name"] for col in result["tables"][0]["columns"]]
-        for row in result["tables"][0]["rows"]:
-            certs.append(dict(zip(columns, row)))
+def service_health_unavailable():
+    return [{
+        "Title": "Dados de Service Health indisponíveis",
+        "Service": "N/A",
+        "subscriptionId": "N/A",
+        "count_": 0
+    }]
 
-    return certs
+# Função para obter o access token do Log Analytics
+def get_access_law_token():
+    return get_token(LOG_ANALYTICS_RESOURCE)
+
+# Maior prazo (em dias) exibido nas seções de expiração do relatório
+KV_EXPIRATION_MAX_DAYS = 90
 
-# Função para obter informações de outros itens KV do Log Analytics
-def get_kv_items_expiration(token):
+# Função para obter certificados e outros itens KV do Log Analytics em uma única consulta
+def get_kv_expiration(token, subscriptions=None):
+    """
+    Obtém a expiração de certificados, chaves e segredos do Key Vault com uma única
+    agregação sobre KVCertificateInfo_CL. Apenas itens vencidos, sem expiração ou que
+    expiram em até KV_EXPIRATION_MAX_DAYS dias são retornados.
+    
+    Args:
+        subscriptions (list): Se informado, restringe aos Key Vaults dessas subscriptions
+    
+    Returns:
+        tuple: (lista de certificados, lista de chaves/segredos), ordenadas por DaysToExpire
+    """
     workspace_id = "63ffa334-8ba1-430d-b851-8a0895443ae3"
     url = f"https://api.loganalytics.azure.com/v1/workspaces/{workspace_id}/query"
     headers = {
@@ -223,390 +288,134 @@ def get_kv_items_expiration(token):
         'Content-Type': 'application/json'
     }
 
-    query = """
+    subscription_filter = ""
+    if subscriptions:
+        lista = ", ".join(f'"{sub}"' for sub in subscriptions)
+        subscription_filter = f"| where Subscription in~ ({lista})"
+
+    query = f"""
     let ItemNameRegex = @"(?i)https://.+?.vault.azure.net/.+?/(.*)";
     KVCertificateInfo_CL
     | summarize arg_max(TimeGenerated, *) by ItemID
-    | where ItemType has_any ("Key", "Secret")
-    | extend Name = extract(ItemNameRegex, 1, ItemID)
+    | where ItemType == "Certificate" or ItemType has_any ("Key", "Secret")
     | extend HasExpirationDate = iif(Expiration > todatetime("1970-01-01"), true, false)
     | extend DaysToExpire = iif(HasExpirationDate == true, toint((Expiration - now()) / 1d), -99999)
+    | where DaysToExpire <= {KV_EXPIRATION_MAX_DAYS}
+    | extend Name = extract(ItemNameRegex, 1, ItemID)
     | extend State = iif(DaysToExpire == -99999, "No Expiration", iif(DaysToExpire <= 30, "Critical", iif(DaysToExpire <= 60, "Warning", "Healthy")))
     | extend Subscription = extract(@"/subscriptions/(.+?)/", 1, KVResourceID)
-    | project State, Subscription, KVResourceID, Name, ItemType, DaysToExpire
-    | top 1000 by DaysToExpire asc
+    {subscription_filter}
+    | extend ItemGroup = iif(ItemType == "Certificate", "Certificate", "KeySecret")
+    | project State, Subscription, KVResourceID, Name, ItemType, DaysToExpire, ItemGroup
+    | partition hint.strategy=native by ItemGroup (top 1000 by DaysToExpire asc)
     """
 
     body = { "query": query }
-    response = requests.post(url, headers=headers, json=body)
+    response = http_client.post(url, headers=headers, json=body)
     response.raise_for_status()
     result = response.json()
 
+    certs = []
     kv_items = []
     if "tables" in result and result["tables"]:
         columns = [col["name"] for col in result["tables"][0]["columns"]]
         for row in result["tables"][0]["rows"]:
-            kv_items.append(dict(zip(columns, row)))
+            item = dict(zip(columns, row))
+            if item.pop("ItemGroup") == "Certificate":
+                certs.append(item)
+            else:
+                kv_items.append(item)
+
+    # O operador partition não garante a ordem entre os grupos
+    certs.sort(key=lambda c: c["DaysToExpire"])
+    kv_items.sort(key=lambda c: c["DaysToExpire"])
+
+    return certs, kv_items
+
+# Função para gerar os gráficos de evolução e de histórico de scores
+# Os cards de evolução usam o estado atual de cada categoria; o histórico completo
+# só é lido pelo gráfico principal (e pelas categorias ainda sem estado gravado)
+def build_charts(subscriptions):
+    # Os módulos de gráficos carregam o matplotlib; importados só quando usados
+    from grafico_score import gerar_grafico_multicategorias
+    from mini_graficos_score import obter_dados_evolucao_todas_categorias
+
+    def grafico_principal():
+        historico = carregar_historico_scores(subscriptions=subscriptions)
+        return historico, gerar_grafico_multicategorias(historico)
+
+    # O gráfico principal é gerado enquanto os mini-gráficos são renderizados
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        grafico_futuro = executor.submit(grafico_principal)
+
+        estados = carregar_estado_scores(subscriptions=subscriptions)
+        series = {categoria: entidades for categoria, (entidades, _) in estados.items()}
+        variacoes = {categoria: variacao for categoria, (_, variacao) in estados.items()}
+
+        # Categorias ainda sem estado gravado usam a série diária: a do gráfico principal,
+        # ou uma leitura própria quando o gráfico principal usa os rollups
+        sem_estado = [categoria for categoria in ADVISOR_CATEGORIES if categoria not in series]
+        if sem_estado:
+            if nivel_rollup(JANELA_HISTORICO_DIAS):
+                historico = carregar_historico_scores(categorias=sem_estado, subscriptions=subscriptions, usar_rollups=False)
+            else:
+                historico, _ = grafico_futuro.result()
+            series.update({categoria: historico.get(categoria, []) for categoria in sem_estado})
 
-    return kv_items
+        dados_evolucao = obter_dados_evolucao_todas_categorias(series, variacoes)
+        return dados_evolucao, grafico_futuro.result()[1]
 
-# Função para gerar relatório HTML
-def generate_html(recommendations_by_category, recommendations_summary, service_health, certificates, kv_items):
+# Função para buscar as fontes de dados do relatório em paralelo
+def fetch_report_sources(sources, max_workers=REPORT_MAX_WORKERS):
+    """
+    Executa as fontes de dados do relatório em paralelo e aguarda todas
+    Cada fonte tem seu próprio timeout; em caso de erro ou timeout usa o valor padrão
     
-    # Obter dados de evolução para todos os cards
-    dados_evolucao = obter_dados_evolucao_todas_categorias()
+    Args:
+        sources (dict): nome -> (função, argumentos, valor padrão)
     
-# Categorizar certificados por faixa de vencimento
-    expired = [c for c in certificates if c['DaysToExpire'] < 0]
-    exp_0_30 = [c for c in certificates if 0 <= c['DaysToExpire'] <= 30]
-    exp_31_60 = [c for c in certificates if 31 <= c['DaysToExpire'] <= 60]
-    exp_61_90 = [c for c in certificates if 61 <= c['DaysToExpire'] <= 90]
-
-    cert_groups = [
-        ("Vencidos", expired),
-        ("Expira em 0–30 dias", exp_0_30),
-        ("Expira em 31–60 dias", exp_31_60),
-        ("Expira em 61–90 dias", exp_61_90)
-    ]
-
-   # Categorizar KV items por faixa de vencimento
-    expired = [c for c in kv_items if c['DaysToExpire'] < 0]
-    exp_0_30 = [c for c in kv_items if 0 <= c['DaysToExpire'] <= 30]
-    exp_31_60 = [c for c in kv_items if 31 <= c['DaysToExpire'] <= 60]
-    exp_61_90 = [c for c in kv_items if 61 <= c['DaysToExpire'] <= 90]
-
-    kv_items_groups = [
-        ("Vencidos", expired),
-        ("Expira em 0–30 dias", exp_0_30),
-        ("Expira em 31–60 dias", exp_31_60),
-        ("Expira em 61–90 dias", exp_61_90)
-    ] 
-
-    # Gerar gráfico de histórico de scores
-    grafico_base64 = gerar_grafico_multicategorias()
-
-    html_template = """
-    <html>
-        <head>
-            <meta charset="UTF-8">
-            <title>Relatório Semanal</title>
-        </head>
-
-        <body style="font-family: Arial, sans-serif; background-color: white; padding: 20px;">
-            <h2 style="color: #324469;">Relatório Semanal</h2>
-
-            <h3 style="margin-top: 30px; color: #324469;">Azure Advisor Scores</h3>
-            <table width="100%" cellpadding="0" cellspacing="0" border="0">
-                <tr>
-                    {% for categoria_key in ["Security", "Cost", "HighAvailability", "OperationalExcellence", "Performance"] %}
-                    <td style="background-color: #f4f4f4; border-radius: 12px; padding: 15px; width: 18%; text-align: center; box-shadow: 0 4px 8px rgba(0,0,0,0.1); position: relative;">
-                        <!-- Cabeçalho do card -->
-                        <table width="100%" cellpadding="0" cellspacing="0" border="0" style="margin-bottom: 8px;">
-                            <tr>
-                                <td style="font-size: 12px; font-weight: bold; color: #324469; text-transform: uppercase; letter-spacing: 0.5px;">
-                                    {{ dados_evolucao[categoria_key].nome_pt }}
-                                </td>
-                                <td style="text-align: right;">
-                                    <!-- Indicador de evolução -->
-                                    {% if dados_evolucao[categoria_key].tendencia == 'up' %}
-                                        <span style="font-size: 10px; color: #10B981; font-weight: bold;">
-                                            ▲ {% set abs_var = dados_evolucao[categoria_key].variacao_percentual if dados_evolucao[categoria_key].variacao_percentual >= 0 else -dados_evolucao[categoria_key].variacao_percentual %}{{ abs_var }}%
-                                        </span>
-                                    {% elif dados_evolucao[categoria_key].tendencia == 'down' %}
-                                        <span style="font-size: 10px; color: #EF4444; font-weight: bold;">
-                                            ▼ {% set abs_var = dados_evolucao[categoria_key].variacao_percentual if dados_evolucao[categoria_key].variacao_percentual >= 0 else -dados_evolucao[categoria_key].variacao_percentual %}{{ abs_var }}%
-                                        </span>
-                                    {% else %}
-                                        <span style="font-size: 10px; color: #6B7280; font-weight: bold;">
-                                            ● 0%
-                                        </span>
-                                    {% endif %}
-                                </td>
-                            </tr>
-                        </table>
-                        
-                        <!-- Score principal -->
-                        <div style="font-size: 28px; font-weight: bold; color: #1F2937; margin-bottom: 8px;">
-                            {{ dados_evolucao[categoria_key].score_atual }}%
-                        </div>
-                        
-                        <!-- Mini-gráfico -->
-                        <div style="height: 40px; text-align: center; margin: 5px 0;">
-                            {% if dados_evolucao[categoria_key].mini_grafico_base64 %}
-                                <img src="data:image/png;base64,{{ dados_evolucao[categoria_key].mini_grafico_base64 }}" 
-                                     alt="Evolução {{ dados_evolucao[categoria_key].nome_pt }}" 
-                                     style="max-width: 100%; height: 35px; opacity: 0.8; vertical-align: middle;" />
-                            {% else %}
-                                <div style="height: 35px; background-color: #D1D5DB; border-radius: 4px; width: 100%;"></div>
-                            {% endif %}
-                        </div>
-                    </td>
-                    {% if not loop.last %}
-                        <td style="width: 13px;"></td>
-                    {% endif %}
-                    {% endfor %}
-                </tr>    
-            </table>
-
-            <h3 style="margin-top: 30px; color: #324469;">Histórico de Scores por Categoria</h3>
-            <div style="text-align: center; margin-bottom: 30px;">
-                <img src="data:image/png;base64,{{ grafico_base64 }}" alt="Histórico de Scores" style="max-width:100%; height:auto; border-radius: 8px; box-shadow: 0 4px 8px rgba(0,0,0,0.1);" />
-            </div>
-
-            <h3 style="margin-top: 30px; color: #324469;">Resumo de Recomendações por Impacto</h3>
-            <table width="100%" cellpadding="0" cellspacing="0" border="0" style="margin-bottom: 20px;">
-                <tr>
-                    {% for category in ["Security", "Cost", "HighAvailability", "OperationalExcellence", "Performance"] %}
-                        <td width="18%" valign="top" style="background-color: #f4f4f4; padding: 15px; border-radius: 8px; box-shadow: 0 2px 5px rgba(0,0,0,0.1); text-align: center;">
-                            <div style="font-size: 14px; font-weight: bold; margin-bottom: 10px; color: #324469;">
-                                {{ category_names[category] }}
-                            </div>
-                            <!-- High Impact -->
-                            <table width="100%" cellpadding="4" cellspacing="0" border="0" style="margin-bottom: 3px; background-color: #FEE2E2; border-radius: 4px; border-left: 4px solid #EF4444;">
-                                <tr>
-                                    <td style="font-size: 11px; font-weight: bold; color: #7F1D1D;">High</td>
-                                    <td style="font-size: 11px; font-weight: bold; color: #7F1D1D; text-align: right;">{{ recommendations_summary[category]['High'] }}</td>
-                                </tr>
-                            </table>
-                            <!-- Medium Impact -->
-                            <table width="100%" cellpadding="4" cellspacing="0" border="0" style="margin-bottom: 3px; background-color: #FEF3C7; border-radius: 4px; border-left: 4px solid #F59E0B;">
-                                <tr>
-                                    <td style="font-size: 11px; font-weight: bold; color: #92400E;">Medium</td>
-                                    <td style="font-size: 11px; font-weight: bold; color: #92400E; text-align: right;">{{ recommendations_summary[category]['Medium'] }}</td>
-                                </tr>
-                            </table>
-                            <!-- Low Impact -->
-                            <table width="100%" cellpadding="4" cellspacing="0" border="0" style="background-color: #DCFCE7; border-radius: 4px; border-left: 4px solid #10B981;">
-                                <tr>
-                                    <td style="font-size: 11px; font-weight: bold; color: #166534;">Low</td>
-                                    <td style="font-size: 11px; font-weight: bold; color: #166534; text-align: right;">{{ recommendations_summary[category]['Low'] }}</td>
-                                </tr>
-                            </table>
-                        </td>
-                        {% if not loop.last %}
-                            <td style="width: 10px;"></td>
-                        {% endif %}
-                    {% endfor %}
-                </tr>
-            </table>
-
-            <h3 style="margin-top: 30px; color: #324469;">Recomendações "High" por Categoria</h3>
-            <table width="100%" cellpadding="0" cellspacing="0" border="0" style="margin-bottom: 20px;">
-                <tr>
-                    {% for category in ["Security", "Cost", "HighAvailability"] %}
-                        <td width="32%" valign="top" style="background-color: #f4f4f4; padding: 15px; border-radius: 12px; box-shadow: 0 4px 8px rgba(0,0,0,0.1); margin-right: 2%;">
-                            <div style="margin-bottom: 12px; padding: 8px; background-color: #324469; border-radius: 8px; text-align: center;">
-                                <div style="font-size: 14px; font-weight: bold; color: white;">
-                                    {{ category_names[category] }}
-                                </div>
-                            </div>
-                            {% for rec in recommendations.get(category, []) %}
-                                <table width="100%" cellpadding="0" cellspacing="0" border="0" style="margin-bottom: 8px; background-color: white; border-radius: 6px; border-left: 4px solid #EF4444;">
-                                    <tr>
-                                        <td width="20" style="padding: 8px 8px 8px 8px; color: #EF4444; font-weight: bold; font-size: 14px; vertical-align: top;">●</td>
-                                        <td style="padding: 8px 8px 8px 0; font-size: 12px; color: #374151; line-height: 1.4;">{{ rec.description }}</td>
-                                    </tr>
-                                </table>
-                            {% else %}
-                                <table width="100%" cellpadding="15" cellspacing="0" border="0" style="background-color: white; border-radius: 6px; border: 2px dashed #D1D5DB;">
-                                    <tr>
-                                        <td style="text-align: center;">
-                                            <span style="color: #10B981; font-size: 16px;">✓</span>
-                                            <span style="font-size: 12px; color: #6B7280; font-style: italic; margin-left: 8px;">Nenhuma recomendação</span>
-                                        </td>
-                                    </tr>
-                                </table>
-                            {% endfor %}
-                        </td>
-                        {% if not loop.last %}
-                            <td style="width: 13px;"></td>
-                        {% endif %}
-                    {% endfor %}
-                </tr>
-            </table>
-
-            <table width="100%" cellpadding="0" cellspacing="0" border="0">
-                <tr>
-                    {% for category in ["OperationalExcellence", "Performance"] %}
-                        <td width="48%" valign="top" style="background-color: #f4f4f4; padding: 15px; border-radius: 12px; box-shadow: 0 4px 8px rgba(0,0,0,0.1);">
-                            <div style="margin-bottom: 12px; padding: 8px; background-color: #324469; border-radius: 8px; text-align: center;">
-                                <div style="font-size: 14px; font-weight: bold; color: white;">
-                                    {{ category_names[category] }}
-                                </div>
-                            </div>
-                            {% for rec in recommendations.get(category, []) %}
-                                <table width="100%" cellpadding="0" cellspacing="0" border="0" style="margin-bottom: 8px; background-color: white; border-radius: 6px; border-left: 4px solid #EF4444;">
-                                    <tr>
-                                        <td width="20" style="padding: 8px 8px 8px 8px; color: #EF4444; font-weight: bold; font-size: 14px; vertical-align: top;">●</td>
-                                        <td style="padding: 8px 8px 8px 0; font-size: 12px; color: #374151; line-height: 1.4;">{{ rec.description }}</td>
-                                    </tr>
-                                </table>
-                            {% else %}
-                                <table width="100%" cellpadding="15" cellspacing="0" border="0" style="background-color: white; border-radius: 6px; border: 2px dashed #D1D5DB;">
-                                    <tr>
-                                        <td style="text-align: center;">
-                                            <span style="color: #10B981; font-size: 16px;">✓</span>
-                                            <span style="font-size: 12px; color: #6B7280; font-style: italic; margin-left: 8px;">Nenhuma recomendação</span>
-                                        </td>
-                                    </tr>
-                                </table>
-                            {% endfor %}
-                        </td>
-                        {% if not loop.last %}
-                            <td style="width: 13px;"></td>
-                        {% endif %}
-                    {% endfor %}
-                </tr>
-            </table>            <h3 style="margin-top: 30px; color: #324469;">Service Health</h3>
-            <div style="background-color: #f4f4f4; border-radius: 12px; padding: 20px; box-shadow: 0 4px 8px rgba(0,0,0,0.1); overflow: hidden;">
-                <table style="width:100%; border-collapse: collapse; background-color: transparent;">
-                    <thead>
-                        <tr style="background-color: #324469; color: white;">
-                            <th style="padding: 12px 15px; font-size: 13px; font-weight: bold; text-align: left; border-radius: 8px 0 0 0;">Alerta</th>
-                            <th style="padding: 12px 15px; font-size: 13px; font-weight: bold; text-align: left;">Serviço</th>
-                            <th style="padding: 12px 15px; font-size: 13px; font-weight: bold; text-align: center;">Itens afetados</th>
-                            <th style="padding: 12px 15px; font-size: 13px; font-weight: bold; text-align: left; border-radius: 0 8px 0 0;">Subscription ID</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-                        {% for item in service_health %}
-                        <tr style="background-color: white; border-bottom: 1px solid #E5E7EB;">
-                            <td style="padding: 12px 15px; font-size: 12px; color: #374151; font-weight: 500;">{{ item.Title }}</td>
-                            <td style="padding: 12px 15px; font-size: 12px; color: #6B7280;">{{ item.Service }}</td>
-                            <td style="padding: 12px 15px; font-size: 12px; color: #374151; text-align: center; font-weight: bold;">
-                                <span style="background-color: #FEE2E2; color: #DC2626; padding: 4px 8px; border-radius: 12px; font-size: 11px;">{{ item.count_ }}</span>
-                            </td>
-                            <td style="padding: 12px 15px; font-size: 11px; color: #6B7280; font-family: monospace;">{{ item.subscriptionId }}</td>
-                        </tr>
-                        {% else %}
-                        <tr style="background-color: white;">
-                            <td colspan="4" style="padding: 20px; text-align: center; font-size: 13px; color: #6B7280; font-style: italic;">
-                                <span style="color: #10B981; font-size: 16px; margin-right: 8px;">✓</span>
-                                Nenhum incidente encontrado
-                            </td>
-                        </tr>
-                        {% endfor %}
-                    </tbody>
-                </table>
-            </div>
-
-            <h3 style="margin-top: 30px; color: #324469;">Expiração de Certificados</h3>
-            <table width="100%" cellpadding="0" cellspacing="0" border="0">
-                <tr>
-                    {% for title, certs in cert_groups %}
-                        <td width="24%" valign="top" style="background-color: #f4f4f4; padding: 15px; border-radius: 12px; box-shadow: 0 4px 8px rgba(0,0,0,0.1); margin-right: 2%;">
-                            <table width="100%" cellpadding="8" cellspacing="0" border="0" style="margin-bottom: 12px; background-color: #324469; border-radius: 8px;">
-                                <tr>
-                                    <td style="font-size: 13px; font-weight: bold; color: white; text-align: center;">
-                                        {{ title }}
-                                    </td>
-                                </tr>
-                            </table>
-                            {% for cert in certs %}
-                                {% if cert.DaysToExpire < 0 %}
-                                    {% set status_color = "#DC2626" %}
-                                    {% set bg_color = "#FEE2E2" %}
-                                    {% set icon = "⚠" %}
-                                {% elif cert.DaysToExpire <= 30 %}
-                                    {% set status_color = "#DC2626" %}
-                                    {% set bg_color = "#FEE2E2" %}
-                                    {% set icon = "🔴" %}
-                                {% elif cert.DaysToExpire <= 60 %}
-                                    {% set status_color = "#D97706" %}
-                                    {% set bg_color = "#FEF3C7" %}
-                                    {% set icon = "🟡" %}
-                                {% else %}
-                                    {% set status_color = "#059669" %}
-                                    {% set bg_color = "#DCFCE7" %}
-                                    {% set icon = "🟢" %}
-                                {% endif %}
-                                <table width="100%" cellpadding="0" cellspacing="0" border="0" style="margin-bottom: 6px; background-color: {{ bg_color }}; border-radius: 6px; border-left: 4px solid {{ status_color }};">
-                                    <tr>
-                                        <td width="25" style="padding: 8px 8px 8px 8px; vertical-align: middle;">{{ icon }}</td>
-                                        <td style="padding: 8px 8px 8px 0; vertical-align: middle;">
-                                            <div style="font-size: 11px; font-weight: bold; color: {{ status_color }};">{{ cert.Name }}</div>
-                                            <div style="font-size: 10px; color: #6B7280;">{{ cert.DaysToExpire }} dias</div>
-                                        </td>
-                                    </tr>
-                                </table>
-                            {% else %}
-                                <table width="100%" cellpadding="15" cellspacing="0" border="0" style="background-color: white; border-radius: 6px; border: 2px dashed #D1D5DB;">
-                                    <tr>
-                                        <td style="text-align: center;">
-                                            <span style="color: #10B981; font-size: 11px; margin-right: 8px;">✓</span>
-                                            <span style="font-size: 11px; color: #6B7280; font-style: italic;">Nenhum certificado</span>
-                                        </td>
-                                    </tr>
-                                </table>
-                            {% endfor %}
-                        </td>
-                        {% if not loop.last %}
-                            <td style="width: 8px;"></td>
-                        {% endif %}
-                    {% endfor %}
-                </tr>
-            </table>  
-
-            <h3 style="margin-top: 30px; color: #324469;">Expiração Itens de Key Vault</h3>
-            <table width="100%" cellpadding="0" cellspacing="0" border="0">
-                <tr>
-                    {% for title, kv_items in kv_items_groups %}
-                        <td width="24%" valign="top" style="background-color: #f4f4f4; padding: 15px; border-radius: 12px; box-shadow: 0 4px 8px rgba(0,0,0,0.1); margin-right: 2%;">
-                            <table width="100%" cellpadding="8" cellspacing="0" border="0" style="margin-bottom: 12px; background-color: #324469; border-radius: 8px;">
-                                <tr>
-                                    <td style="font-size: 13px; font-weight: bold; color: white; text-align: center;">
-                                        {{ title }}
-                                    </td>
-                                </tr>
-                            </table>
-                            {% for kv_item in kv_items %}
-                                {% if kv_item.DaysToExpire < 0 %}
-                                    {% set status_color = "#DC2626" %}
-                                    {% set bg_color = "#FEE2E2" %}
-                                    {% set icon = "⚠" %}
-                                {% elif kv_item.DaysToExpire <= 30 %}
-                                    {% set status_color = "#DC2626" %}
-                                    {% set bg_color = "#FEE2E2" %}
-                                    {% set icon = "🔴" %}
-                                {% elif kv_item.DaysToExpire <= 60 %}
-                                    {% set status_color = "#D97706" %}
-                                    {% set bg_color = "#FEF3C7" %}
-                                    {% set icon = "🟡" %}
-                                {% else %}
-                                    {% set status_color = "#059669" %}
-                                    {% set bg_color = "#DCFCE7" %}
-                                    {% set icon = "🟢" %}
-                                {% endif %}
-                                <table width="100%" cellpadding="0" cellspacing="0" border="0" style="margin-bottom: 6px; background-color: {{ bg_color }}; border-radius: 6px; border-left: 4px solid {{ status_color }};">
-                                    <tr>
-                                        <td width="25" style="padding: 8px 8px 8px 8px; vertical-align: middle;">{{ icon }}</td>
-                                        <td style="padding: 8px 8px 8px 0; vertical-align: middle;">
-                                            <div style="font-size: 11px; font-weight: bold; color: {{ status_color }};">{{ kv_item.Name }}</div>
-                                            <div style="font-size: 10px; color: #6B7280;">{{ kv_item.DaysToExpire }} dias - {{ kv_item.ItemType }}</div>
-                                        </td>
-                                    </tr>
-                                </table>
-                            {% else %}
-                                <table width="100%" cellpadding="15" cellspacing="0" border="0" style="background-color: white; border-radius: 6px; border: 2px dashed #D1D5DB;">
-                                    <tr>
-                                        <td style="text-align: center;">
-                                            <span style="color: #10B981; font-size: 11px; margin-right: 8px;">✓</span>
-                                            <span style="font-size: 11px; color: #6B7280; font-style: italic;">Nenhum item</span>
-                                        </td>
-                                    </tr>
-                                </table>
-                            {% endfor %}
-                        </td>
-                        {% if not loop.last %}
-                            <td style="width: 8px;"></td>
-                        {% endif %}
-                    {% endfor %}
-                </tr>
-            </table>        </body>
-    </html>
+    Returns:
+        tuple: (dict nome -> resultado da fonte ou valor padrão,
+        lista das fontes que usaram o valor padrão)
     """
-    template = Template(html_template)
-    return template.render(
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    inicio = time.monotonic()
+    futures = {
+        name: executor.submit(fn, *args)
+        for name, (fn, args, _) in sources.items()
+    }
+
+    results = {}
+    indisponiveis = []
+    try:
+        for name, future in futures.items():
+            default = sources[name][2]
+            timeout = REPORT_SOURCE_TIMEOUTS.get(name, 60)
+            remaining = max(0, timeout - (time.monotonic() - inicio))
+            try:
+                results[name] = future.result(timeout=remaining)
+            except FuturesTimeoutError:
+                logging.warning(f"Timeout de {timeout}s ao obter '{name}'. Usando valor padrão.")
+                results[name] = default
+                indisponiveis.append(name)
+            except Exception as e:
+                logging.error(f"Erro ao obter '{name}': {e}. Usando valor padrão.")
+                results[name] = default
+                indisponiveis.append(name)
+    finally:
+        # Não bloquear a resposta aguardando fontes que estouraram o timeout
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results, indisponiveis
+
+# Função para montar o contexto do template do relatório
+def build_report_context(recommendations_by_category, recommendations_summary, service_health, certificates, kv_items, dados_evolucao, grafico_base64, escopo=""):
+    
+    # Categorizar certificados e KV items por faixa de vencimento (None = indisponível)
+    cert_groups = agrupar_por_vencimento(certificates) if certificates is not None else None
+    kv_items_groups = agrupar_por_vencimento(kv_items) if kv_items is not None else None
+
+    return dict(
         dados_evolucao=dados_evolucao,
         recommendations=recommendations_by_category,
         recommendations_summary=recommendations_summary,
@@ -620,84 +429,196 @@ def generate_html(recommendations_by_category, recommendations_summary, service_
         service_health=service_health,
         cert_groups=cert_groups,
         kv_items_groups=kv_items_groups,
-        grafico_base64=grafico_base64
-)
-
-# Azure Function App
-
-app = func.FunctionApp(http_auth_level=func.AuthLevel.FUNCTION)
+        grafico_base64=grafico_base64,
+        escopo=escopo
+    )
+
+# Ambiente Jinja compilado uma vez por worker; o bytecode do template também
+# fica em disco para ser reaproveitado após um cold start
+@functools.lru_cache(maxsize=None)
+def get_report_template():
+    from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+
+    env = Environment(
+        loader=FileSystemLoader(TEMPLATES_DIR),
+        bytecode_cache=FileSystemBytecodeCache(),
+        auto_reload=False
+    )
+    return env.get_template(REPORT_TEMPLATE)
 
-@app.route(route="getDataAdvisor")
-def getDataAdvisor(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info('Azure Function getDataAdvisor foi acionada.')
+# Função para gerar relatório HTML
+def generate_html(*args, **kwargs):
+    return get_report_template().render(build_report_context(*args, **kwargs))
 
-    try:
-        token = get_access_token()
-        law_token = get_access_law_token()
-        
-        # Obter e organizar recomendações por categoria
-        raw_recommendations = get_recommendations(token)
+# Função para montar o relatório de um conjunto de subscriptions
+def build_report(subscriptions, subscription=None):
+    """
+    Coleta os dados e gera o HTML do relatório
+    
+    Args:
+        subscriptions (list): Subscriptions consolidadas no relatório
+        subscription (str): Se informada, gera o relatório apenas dessa subscription
+    
+    Returns:
+        tuple: (HTML do relatório, fontes indisponíveis ou parciais no relatório)
+    """
+    token = get_access_token()
+    law_token = get_access_law_token()
+
+    if subscription:
+        subscriptions = [subscription]
+        escopo = f"Subscription {subscription}"
+    elif len(subscriptions) == 1:
+        escopo = f"Subscription {subscriptions[0]}"
+    else:
+        escopo = f"{len(subscriptions)} subscriptions"
+
+    # O workspace pode conter Key Vaults de outras subscriptions; filtrar sempre que o
+    # escopo for configurado explicitamente, para acompanhar as demais seções
+    kv_subscriptions = subscriptions if subscription or SUBSCRIPTION_IDS or MANAGEMENT_GROUP_ID else None
+
+    # Buscar todas as fontes em paralelo; uma fonte lenta ou com erro
+    # não impede a geração do restante do relatório. Os valores padrão (None)
+    # marcam a seção como indisponível no template, em vez de vazia
+    dados, indisponiveis = fetch_report_sources({
+        "recommendations": (get_recommendations_all, (token, subscriptions), (None, None, [])),
+        "service_health": (get_service_health, (token, subscriptions), service_health_unavailable()),
+        "kv_expiration": (get_kv_expiration, (law_token, kv_subscriptions), (None, None)),
+        "charts": (build_charts, (subscriptions,), (None, None)),
+    })
+    raw_recommendations, recommendations_summary, falhas_recomendacoes = dados["recommendations"]
+    if falhas_recomendacoes:
+        indisponiveis.append("recommendations")
+        escopo += f" (recomendações parciais: indisponíveis em {len(falhas_recomendacoes)} de {len(subscriptions)} subscriptions)"
+    certificates, kv_items = dados["kv_expiration"]
+    dados_evolucao, grafico_base64 = dados["charts"]
+
+    # Organizar recomendações por categoria
+    recommendations_by_category = None
+    if raw_recommendations is not None:
         recommendations_by_category = {cat: [] for cat in ADVISOR_CATEGORIES}
-        
         for rec in raw_recommendations:
             cat = rec["category"]
             if cat in recommendations_by_category:
                 recommendations_by_category[cat].append(rec)
 
-        # Obter resumo de recomendações por impacto
-        recommendations_summary = get_recommendations_summary(token)
-
-        # Obter dados de Service Health
-        resource_graph_data = query_resource_graph(token)
-        service_health_data = []
-
-        data_section = resource_graph_data.get("data", {})
-
-        # Verifica se 'data' é um dicionário e contém 'rows'
-        if isinstance(data_section, dict) and "rows" in data_section:
-            rows = data_section["rows"]
-            if rows:
-                for row in rows:
-                    service_health_data.append({
-                        "Title": row[0],
-                        "Service": row[1],
-                        "subscriptionId": row[2],
-                        "count_": row[3]
-                    })
-            else:
-                service_health_data.append({
-                    "Title": "Nenhum incidente encontrado",
-                    "Service": "N/A",
-                    "subscriptionId": "N/A",
-                    "count_": 0
-                })
-        else:
-            # Caso 'data' não seja um dicionário ou não tenha 'rows'
-            service_health_data.append({
-                "Title": "Dados de Service Health indisponíveis",
-                "Service": "N/A",
-                "subscriptionId": "N/A",
-                "count_": 0
-            })
-        
-        # Obter certificados do Log Analytics
-        certificates = get_kv_certificates_expiration(law_token)
+    html_report = generate_html(
+        recommendations_by_category,
+        recommendations_summary,
+        dados["service_health"],
+        certificates,
+        kv_items,
+        dados_evolucao,
+        grafico_base64,
+        escopo
+    )
+    return html_report, indisponiveis
 
-        # Obter outros itens do Key Vault do Log Analytics
-        kv_items = get_kv_items_expiration(law_token)
+# Azure Function App
 
-        
-        html_report = generate_html(recommendations_by_category, recommendations_summary, service_health_data, certificates, kv_items)
+app = func.FunctionApp(http_auth_level=func.AuthLevel.FUNCTION)
 
-        return func.HttpResponse(
-            body=html_report,
-            mimetype="text/html",
-            status_code=200
-        )
+# Função para gerar o relatório e gravá-lo como snapshot
+# Um relatório com fontes indisponíveis não substitui o último snapshot completo;
+# nesse caso, ou se a gravação falhar, o relatório gerado é retornado sem ETag
+def gerar_snapshot(subscriptions, subscription=None):
+    html_report, indisponiveis = build_report(subscriptions, subscription)
+    if indisponiveis:
+        logging.warning(f"Relatório gerado sem as fontes {', '.join(indisponiveis)}. Snapshot anterior mantido.")
+        return {"html": html_report, "etag": None, "last_modified": None}
+
+    try:
+        return salvar_snapshot(html_report, subscription)
+    except Exception as e:
+        logging.error(f"Erro ao gravar snapshot do relatório: {e}")
+        return {"html": html_report, "etag": None, "last_modified": None}
+
+# Função para verificar se o snapshot passou da idade máxima
+def snapshot_expirado(snapshot):
+    limite = datetime.now(timezone.utc) - timedelta(hours=REPORT_SNAPSHOT_MAX_AGE_HOURS)
+    return snapshot["last_modified"] is not None and snapshot["last_modified"] < limite
+
+# Função para montar a resposta HTTP de um snapshot, com ETag e Last-Modified
+def snapshot_response(snapshot):
+    headers = {"Cache-Control": "no-cache"}
+    if snapshot["etag"]:
+        headers["ETag"] = snapshot["etag"]
+    if snapshot["last_modified"]:
+        headers["Last-Modified"] = format_datetime(snapshot["last_modified"], usegmt=True)
+
+    # O cliente já tem a versão atual (If-None-Match)
+    if snapshot["html"] is None:
+        return func.HttpResponse(status_code=304, headers=headers)
+
+    return func.HttpResponse(
+        body=snapshot["html"],
+        mimetype="text/html",
+        status_code=200,
+        headers=headers
+    )
+
+@app.route(route="getDataAdvisor")
+def getDataAdvisor(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Azure Function getDataAdvisor foi acionada.')
+
+    try:
+        # ?subscription=<id> gera o relatório de uma única subscription
+        subscription = req.params.get("subscription")
+
+        # O snapshot pré-gerado pelo timer é servido direto; ?refresh=true força a regeneração
+        if req.params.get("refresh", "").lower() != "true":
+            try:
+                snapshot = ler_snapshot(subscription, req.headers.get("If-None-Match"))
+            except Exception as e:
+                logging.warning(f"Erro ao ler snapshot do relatório: {e}. Gerando o relatório.")
+                snapshot = None
+            if snapshot and snapshot_expirado(snapshot):
+                logging.warning(
+                    f"Snapshot do relatório gerado em {snapshot['last_modified']} excede "
+                    f"{REPORT_SNAPSHOT_MAX_AGE_HOURS}h. Verifique o timer gerarSnapshotsRelatorio; gerando o relatório."
+                )
+                snapshot = None
+            if snapshot:
+                return snapshot_response(snapshot)
+
+        subscriptions = listar_subscriptions(get_access_token())
+        if subscription and subscription not in subscriptions:
+            return func.HttpResponse(
+                "Subscription não incluída no relatório.",
+                status_code=404
+            )
+
+        return snapshot_response(gerar_snapshot(subscriptions, subscription))
     except Exception as e:
         logging.error(f"Erro ao gerar relatório: {e}")
         return func.HttpResponse(
             "Erro ao obter dados.",
             status_code=500
         )
+
+@app.timer_trigger(schedule=REPORT_SNAPSHOT_SCHEDULE, arg_name="timer", run_on_startup=False)
+def gerarSnapshotsRelatorio(timer: func.TimerRequest) -> None:
+    """
+    Pré-gera o relatório consolidado e atualiza os snapshots de subscriptions
+    que já foram pedidos individualmente (?subscription=); os de subscriptions
+    que saíram do escopo são excluídos
+    """
+    logging.info('Gerando snapshots do relatório.')
+
+    subscriptions = listar_subscriptions(get_access_token())
+    try:
+        gerar_snapshot(subscriptions)
+    except Exception as e:
+        logging.error(f"Erro ao gerar snapshot do relatório consolidado: {e}")
+
+    for subscription in listar_snapshots_subscriptions():
+        try:
+            if subscription not in subscriptions:
+                excluir_snapshot(subscription)
+                logging.info(f"Snapshot da subscription {subscription}, fora do escopo, excluído.")
+                continue
+            gerar_snapshot(subscriptions, subscription)
+        except Exception as e:
+            logging.error(f"Erro ao gerar snapshot da subscription {subscription}: {e}")
+
 import publishScores
\ No newline at end of file
@@ -1,65 +1,95 @@
-import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+from matplotlib.figure import Figure
+from matplotlib.ticker import FuncFormatter
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import io
 import base64
+import numpy as np
 from datetime import datetime
-from azure.data.tables import TableClient
-from azure.identity import ClientSecretCredential
+from datas import converter_rowkeys, converter_data
+from cache_graficos import chave_grafico, obter_ou_gerar, serie_de_entidades
 
-def converter_data_string(data_str):
-    """Converte string de data para objeto datetime, tentando vários formatos"""
-    # Limpar a string removendo 'Z' e microsegundos se existirem
-    data_limpa = str(data_str).strip()
-    if data_limpa.endswith('Z'):
-        data_limpa = data_limpa[:-1]  # Remove o 'Z'
-    
-    # Se contém microsegundos, remover
-    if '.' in data_limpa and 'T' in data_limpa:
-        partes = data_limpa.split('.')
-        if len(partes) == 2:
-            data_limpa = partes[0]  # Mantém apenas a parte antes dos microsegundos
+# Abreviações dos meses em português (pt-BR), indexadas por mês - 1
+MESES_PT = ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun',
+            'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
+
+def formatar_data_pt(data):
+    """Formata uma data como 'dd/Mês' com o mês abreviado em português"""
+    return f"{data.day:02d}/{MESES_PT[data.month - 1]}"
+
+def formatador_datas_pt(x, pos=None):
+    """Formatter do eixo X: converte o valor numérico do matplotlib em 'dd/Mês' pt-BR"""
+    return formatar_data_pt(mdates.num2date(x))
+
+# Posições dos rótulos conforme a quantidade de rótulos anteriores no mesmo ponto:
+# (deslocamento em pontos, alinhamento vertical, alinhamento horizontal)
+POSICOES_ROTULO = [
+    ((0, 15), 'bottom', 'center'),   # Primeiro: acima
+    ((-25, 5), 'center', 'right'),   # Segundo: esquerda
+    ((25, 5), 'center', 'left'),     # Terceiro: direita
+    ((0, -15), 'top', 'center'),     # Quarto: abaixo
+]
+
+def calcular_ocupacao_rotulos(indices, scores, distancia=1):
+    """
+    Conta, para cada rótulo, quantos rótulos anteriores estão no mesmo índice
+    com score a menos de 'distancia' pontos (e portanto se sobrepõem a ele)
     
-    formatos = [
-        "%Y-%m-%dT%H:%M:%S",    # 2025-09-25T00:00:00
-        "%Y-%m-%d",             # 2025-09-25
-        "%Y-%m-%dT%H:%M",       # 2025-09-25T00:00
-        "%d/%m/%Y",             # 25/09/2025
-        "%d-%m-%Y",             # 25-09-2025
-        "%Y/%m/%d",             # 2025/09/25
-    ]
+    Os rótulos são ordenados por (índice, score) uma única vez e a vizinhança de cada
+    um é localizada por busca binária, resolvendo todas as categorias de uma vez
     
-    for formato in formatos:
-        try:
-            return datetime.strptime(data_limpa, formato)
-        except ValueError:
-            continue
+    Args:
+        indices (list): Índice do ponto de cada rótulo na série
+        scores (list): Score de cada rótulo
+        distancia (float): Diferença de score a partir da qual não há sobreposição
     
-    # Se não conseguir converter, retorna a string original
-    return data_str
+    Returns:
+        numpy.ndarray: Quantidade de rótulos anteriores sobrepostos, na ordem de entrada
+    """
+    total = len(indices)
+    if total == 0:
+        return np.zeros(0, dtype=int)
 
-def obter_mapeamento_meses_portugues():
-    """Retorna o mapeamento de abreviações de meses do inglês para português"""
-    months_pt = {
-        'Jan': 'Jan', 'Feb': 'Fev', 'Mar': 'Mar', 'Apr': 'Abr',
-        'May': 'Mai', 'Jun': 'Jun', 'Jul': 'Jul', 'Aug': 'Ago',
-        'Sep': 'Set', 'Oct': 'Out', 'Nov': 'Nov', 'Dec': 'Dez'
-    }
-    return months_pt
+    indices = np.asarray(indices, dtype=float)
+    scores = np.asarray(scores, dtype=float)
+
+    # Chave única que separa os índices por um intervalo maior que qualquer diferença de score
+    espacamento = np.ptp(scores) + 2 * distancia + 1
+    chaves = indices * espacamento + scores
+    ordem = np.argsort(chaves, kind='stable')
+    chaves_ordenadas = chaves[ordem]
+
+    # Vizinhança de cada rótulo no vetor ordenado: (chave - distancia, chave + distancia)
+    inicio = np.searchsorted(chaves_ordenadas, chaves_ordenadas - distancia, side='right')
+    fim = np.searchsorted(chaves_ordenadas, chaves_ordenadas + distancia, side='left')
 
-def gerar_grafico_multicategorias():
-    # Limpar posições ocupadas da geração anterior
-    if hasattr(gerar_grafico_multicategorias, '_occupied_positions'):
-        gerar_grafico_multicategorias._occupied_positions = {}
+    # Percorrer todas as vizinhanças ao mesmo tempo, até o tamanho da maior delas
+    largura = int((fim - inicio).max())
+    posicoes = inicio[:, None] + np.arange(largura)[None, :]
+    validas = posicoes < fim[:, None]
+    vizinhos = ordem[np.minimum(posicoes, total - 1)]
+    anteriores = validas & (vizinhos < ordem[:, None])
+
+    ocupacao = np.empty(total, dtype=int)
+    ocupacao[ordem] = anteriores.sum(axis=1)
+    return ocupacao
+
+def gerar_grafico_multicategorias(historico):
+    """
+    Gera o gráfico de linhas com o histórico de scores de todas as categorias
+    O resultado fica em cache enquanto o histórico não mudar
     
-    import os
-    credential = ClientSecretCredential(
-        tenant_id=os.getenv("TENANT_ID"),
-        client_id=os.getenv("CLIENT_ID"),
-        client_secret=os.getenv("CLIENT_SECRET")
-    )
-    table_url = "https://storagescores.table.core.windows.net"
-    table_client = TableClient(endpoint=table_url, table_name="AdvisorScores", credential=credential)
+    Args:
+        historico (dict): categoria -> entidades ordenadas por RowKey (ver historico_scores)
+    
+    Returns:
+        str: Imagem PNG em base64
+    """
+    series = {categoria: serie_de_entidades(entidades) for categoria, entidades in historico.items()}
+    chave = chave_grafico("multicategorias", series)
+    return obter_ou_gerar(chave, lambda: _renderizar_grafico_multicategorias(historico))
 
+def _renderizar_grafico_multicategorias(historico):
     categorias = ["Cost", "Security", "HighAvailability", "OperationalExcellence", "Performance"]
     # Paleta de cores
     cores = {
@@ -82,23 +112,20 @@ def gerar_grafico_multicategorias():
     dados_por_categoria = {}
 
     for categoria in categorias:
-        entidades = table_client.query_entities(f"PartitionKey eq '{categoria}'")
-        ordenados = sorted(entidades, key=lambda x: x["RowKey"])
-        
         # Converter strings de data para objetos datetime para melhor formatação
-        datas_convertidas = []
-        for data_str in [e["RowKey"] for e in ordenados]:
-            data_convertida = converter_data_string(data_str)
-            datas_convertidas.append(data_convertida)
+        datas_convertidas, ordenados = converter_rowkeys(historico.get(categoria, []), categoria)
         
         scores = [e["Score"] for e in ordenados]
         dados_por_categoria[categoria] = (datas_convertidas, scores)
 
-    # Configurar o estilo do matplotlib para melhor aparência
-    plt.style.use('default')  # Usar estilo padrão limpo
-    
     # Gerar gráfico com tamanho otimizado (sem título)
-    fig, ax = plt.subplots(figsize=(14, 6), dpi=100)
+    # Figura independente do pyplot, sem estado global: pode ser gerada em paralelo
+    fig = Figure(figsize=(14, 6), dpi=100)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    
+    # Rótulos de todas as categorias; posicionados juntos depois de plotar as linhas
+    rotulos = []
     
     for categoria, (datas, scores) in dados_por_categoria.items():
         cor = cores.get(categoria, "#1f77b4")  # Cor padrão se não encontrar
@@ -130,67 +157,36 @@ def gerar_grafico_multicategorias():
                 # Se poucos pontos, mostrar todos
                 indices_mostrar = list(range(num_pontos))
             
-            # Armazenar posições ocupadas por índice e valor para evitar sobreposição
-            if not hasattr(gerar_grafico_multicategorias, '_occupied_positions'):
-                gerar_grafico_multicategorias._occupied_positions = {}
-            
             for i in indices_mostrar:
-                if isinstance(x_values, range):
-                    x_pos = x_values[i]
-                else:
-                    x_pos = x_values[i]
-                score_val = scores[i]
-                
-                # Criar chave baseada no índice e score (sem usar coordenadas datetime)
-                pos_key = f"{i}_{score_val:.0f}"
-                
-                # Verificar quantas posições já ocupadas neste ponto
-                occupied_count = 0
-                for existing_key in gerar_grafico_multicategorias._occupied_positions:
-                    existing_i, existing_score = existing_key.split('_')
-                    if int(existing_i) == i and abs(float(existing_score) - score_val) < 1:
-                        occupied_count += 1
-                
-                # Adicionar esta posição
-                gerar_grafico_multicategorias._occupied_positions[pos_key] = True
-                
-                # Calcular offset baseado na sobreposição
-                if occupied_count == 0:
-                    xytext_offset = (0, 15)  # Primeiro: acima
-                    va_alignment = 'bottom'
-                    ha_alignment = 'center'
-                elif occupied_count == 1:
-                    xytext_offset = (-25, 5)  # Segundo: esquerda
-                    va_alignment = 'center'
-                    ha_alignment = 'right'
-                elif occupied_count == 2:
-                    xytext_offset = (25, 5)  # Terceiro: direita
-                    va_alignment = 'center'
-                    ha_alignment = 'left'
-                elif occupied_count == 3:
-                    xytext_offset = (0, -15)  # Quarto: abaixo
-                    va_alignment = 'top'
-                    ha_alignment = 'center'
-                else:
-                    # Alternativa para casos extremos
-                    xytext_offset = (0, 15)
-                    va_alignment = 'bottom'
-                    ha_alignment = 'center'
-                
-                ax.annotate(f'{score_val:.0f}%', 
-                           (x_pos, score_val), 
-                           textcoords="offset points", 
-                           xytext=xytext_offset, 
-                           ha=ha_alignment, 
-                           va=va_alignment,
-                           fontsize=9, 
-                           fontweight='bold',
-                           color=cor,
-                           bbox=dict(boxstyle="round,pad=0.2", 
-                                    facecolor='white', 
-                                    edgecolor=cor, 
-                                    alpha=0.95,
-                                    linewidth=1))
+                rotulos.append((i, x_values[i], scores[i], cor))
+    
+    # Calcular quantos rótulos anteriores disputam a mesma posição de cada rótulo
+    ocupacao = calcular_ocupacao_rotulos(
+        [indice for indice, _, _, _ in rotulos],
+        [score_val for _, _, score_val, _ in rotulos]
+    )
+    
+    for (_, x_pos, score_val, cor), occupied_count in zip(rotulos, ocupacao):
+        # Calcular offset baseado na sobreposição
+        # Alternativa para casos extremos: acima
+        if occupied_count >= len(POSICOES_ROTULO):
+            occupied_count = 0
+        xytext_offset, va_alignment, ha_alignment = POSICOES_ROTULO[occupied_count]
+        
+        ax.annotate(f'{score_val:.0f}%', 
+                   (x_pos, score_val), 
+                   textcoords="offset points", 
+                   xytext=xytext_offset, 
+                   ha=ha_alignment, 
+                   va=va_alignment,
+                   fontsize=9, 
+                   fontweight='bold',
+                   color=cor,
+                   bbox=dict(boxstyle="round,pad=0.2", 
+                            facecolor='white', 
+                            edgecolor=cor, 
+                            alpha=0.95,
+                            linewidth=1))
 
     # Configurações do gráfico 
     ax.set_xlabel("Data", fontsize=12, fontweight='bold')
@@ -204,55 +200,24 @@ def gerar_grafico_multicategorias():
         
         if datas_exemplo and isinstance(datas_exemplo[0], datetime):
             # Determinar intervalo baseado na quantidade de dados
+            # O intervalo é medido em dias, para valer também para séries semanais e mensais
             num_pontos = len(datas_exemplo)
             if num_pontos > 10:
-                interval = max(1, num_pontos // 8)  # Mostrar ~8 labels
+                dias = (datas_exemplo[-1] - datas_exemplo[0]).days + 1
+                interval = max(1, dias // 8)  # Mostrar ~8 labels
             else:
                 interval = 1
                 
             ax.xaxis.set_major_locator(mdates.DayLocator(interval=interval))
-            ax.xaxis.set_major_formatter(mdates.DateFormatter('%d/%b'))
-            
-            # Aplicar formatação brasileira
-            months_pt = obter_mapeamento_meses_portugues()
-            
-            # Forçar o matplotlib a atualizar e aplicar formatação portuguesa
-            fig.canvas.draw()
-            labels = []
-            for tick in ax.get_xticklabels():
-                text = tick.get_text()
-                for eng, pt in months_pt.items():
-                    text = text.replace(eng, pt)
-                labels.append(text)
-            ax.set_xticklabels(labels)
+            # Meses em português aplicados pelo próprio formatter, em um único desenho
+            ax.xaxis.set_major_formatter(FuncFormatter(formatador_datas_pt))
         else:
-            # Se não são datetime, tentar formatar as strings de data diretamente
+            # Se não são datetime, formatar as strings de data com o mesmo padrão pt-BR
             if datas_exemplo:
-                # Pegar uma amostra das datas para formatação
-                datas_formatadas = []
-                for data in datas_exemplo:
-                    if isinstance(data, str):
-                        # Tentar converter e formatar a string de data
-                        try:
-                            if 'T' in data:  # Formato ISO
-                                data_clean = data.split('T')[0]  # Remove hora
-                                dt = datetime.strptime(data_clean, '%Y-%m-%d')
-                                datas_formatadas.append(dt.strftime('%d/%b'))
-                            else:
-                                datas_formatadas.append(data)
-                        except:
-                            datas_formatadas.append(data)
-                    else:
-                        datas_formatadas.append(str(data))
-                
-                # Aplicar formatação brasileira nas datas
-                months_pt = obter_mapeamento_meses_portugues()
                 datas_pt = []
-                for data in datas_formatadas:
-                    data_pt = data
-                    for eng, pt in months_pt.items():
-                        data_pt = data_pt.replace(eng, pt)
-                    datas_pt.append(data_pt)
+                for data in datas_exemplo:
+                    data_convertida = converter_data(data) if isinstance(data, str) else None
+                    datas_pt.append(formatar_data_pt(data_convertida) if data_convertida else str(data))
                 
                 # Configurar os ticks do eixo X
                 num_ticks = min(8, len(datas_pt))  # Máximo 8 labels
@@ -264,7 +229,7 @@ def gerar_grafico_multicategorias():
                     ax.set_xticks(range(len(datas_pt)))
                     ax.set_xticklabels(datas_pt)
     
-    plt.xticks(rotation=45)
+    ax.tick_params(axis='x', labelrotation=45)
     
     # Adicionar grade sutil para melhor legibilidade
     ax.grid(True, linestyle='--', alpha=0.3, color='#E5E7EB', linewidth=0.5)
@@ -333,16 +298,15 @@ def gerar_grafico_multicategorias():
     ax.tick_params(axis='y', labelsize=10)
     
     # Melhorar o layout
-    plt.tight_layout()
+    fig.tight_layout()
     
     # Adicionar margem extra para a legenda e garantir espaço superior
-    plt.subplots_adjust(right=0.85, top=0.95)
+    fig.subplots_adjust(right=0.85, top=0.95)
 
     # Salvar com alta qualidade
     buffer = io.BytesIO()
-    plt.savefig(buffer, format='png', dpi=150, bbox_inches='tight')
+    fig.savefig(buffer, format='png', dpi=150, bbox_inches='tight')
     buffer.seek(0)
     imagem_base64 = base64.b64encode(buffer.read()).decode('utf-8')
-    plt.close()
 
     return imagem_base64
\ No newline at end of file
@@ -0,0 +1,303 @@
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from azure_auth import CachedTokenCredential
+from datas import converter_data
+from subscriptions import chave_particao
+
+# Tabela onde o publishScores registra os scores do Azure Advisor
+TABLE_URL = "https://storagescores.table.core.windows.net"
+TABLE_NAME = "AdvisorScores"
+
+CATEGORIAS = ["Cost", "Security", "HighAvailability", "OperationalExcellence", "Performance"]
+
+# Janela padrão (em dias) do histórico exibido no relatório; 0 carrega todo o histórico
+JANELA_HISTORICO_DIAS = int(os.getenv("SCORE_HISTORY_DAYS", "90"))
+
+# Número máximo de partições consultadas ao mesmo tempo
+HISTORICO_MAX_WORKERS = int(os.getenv("HISTORICO_MAX_WORKERS", "10"))
+
+# Colunas necessárias para os gráficos
+COLUNAS_HISTORICO = ["PartitionKey", "RowKey", "Score"]
+
+# Rollups pré-agregados mantidos pelo registroScores ao lado das partições diárias
+# nível -> função que retorna o início do período que contém a data
+NIVEIS_ROLLUP = {
+    "semanal": lambda data: data - timedelta(days=data.weekday()),
+    "mensal": lambda data: data.replace(day=1),
+}
+
+# Janelas (em dias) a partir das quais o relatório lê os rollups em vez da série diária
+ROLLUP_SEMANAL_DIAS = int(os.getenv("SCORE_ROLLUP_WEEKLY_DAYS", "180"))
+ROLLUP_MENSAL_DIAS = int(os.getenv("SCORE_ROLLUP_MONTHLY_DAYS", "730"))
+
+# Partição com o "estado atual" de cada categoria (uma entidade por categoria, RowKey = categoria)
+PARTICAO_ESTADO = "EstadoAtual"
+
+# Quantidade de pontos mais recentes guardados no estado para os mini-gráficos
+PONTOS_ESTADO = int(os.getenv("SCORE_STATE_POINTS", "30"))
+
+# Cliente compartilhado entre as invocações do mesmo worker
+_table_client = None
+_table_client_lock = threading.Lock()
+
+def obter_table_client():
+    """Retorna o TableClient compartilhado da tabela AdvisorScores"""
+    global _table_client
+    if _table_client is None:
+        with _table_client_lock:
+            if _table_client is None:
+                from azure.data.tables import TableClient
+                _table_client = TableClient(endpoint=TABLE_URL, table_name=TABLE_NAME, credential=CachedTokenCredential())
+    return _table_client
+
+def chave_particao_rollup(partition_key, nivel):
+    """Retorna a PartitionKey do rollup 'nivel' da partição diária informada"""
+    return f"{partition_key}_{nivel}"
+
+def inicio_periodo(row_key, nivel):
+    """Retorna o início (data ISO) do período do rollup que contém a data, ou None"""
+    data = converter_data(row_key)
+    if data is None:
+        return None
+    return NIVEIS_ROLLUP[nivel](data.date()).isoformat()
+
+def inicio_janela_rollups(row_key):
+    """Retorna a data a partir da qual a série diária cobre todos os períodos que contêm row_key"""
+    inicios = [inicio_periodo(row_key, nivel) for nivel in NIVEIS_ROLLUP]
+    return min(inicios) if None not in inicios else row_key
+
+def calcular_rollups(partition_key, pontos, datas_novas, niveis=NIVEIS_ROLLUP):
+    """
+    Calcula as entidades de rollup dos períodos que contêm alguma das datas novas
+    
+    Args:
+        partition_key (str): Partição diária de origem
+        pontos (dict): data (RowKey) -> score, com todas as datas desses períodos
+        datas_novas (iterable): Datas que acabaram de ser gravadas
+        niveis (iterable): Níveis de rollup calculados
+    
+    Returns:
+        list: Entidades com Min, Max, Mean e Count do período; o Score é o último
+        score do período, para que o valor atual do relatório continue sendo o do Advisor
+    """
+    entidades = []
+    for nivel in niveis:
+        afetados = {inicio_periodo(data, nivel) for data in datas_novas} - {None}
+
+        por_periodo = {}
+        for data in sorted(pontos):
+            inicio = inicio_periodo(data, nivel)
+            if inicio in afetados:
+                por_periodo.setdefault(inicio, []).append(pontos[data])
+
+        for inicio, scores in por_periodo.items():
+            entidades.append({
+                "PartitionKey": chave_particao_rollup(partition_key, nivel),
+                "RowKey": inicio,
+                "Score": scores[-1],
+                "Min": min(scores),
+                "Max": max(scores),
+                "Mean": round(sum(scores) / len(scores), 2),
+                "Count": len(scores)
+            })
+    return entidades
+
+def nivel_rollup(dias):
+    """
+    Escolhe o rollup lido para a janela de 'dias'; None usa a série diária
+    0 (todo o histórico) continua lendo a série diária completa
+    """
+    if not dias:
+        return None
+    if dias >= ROLLUP_MENSAL_DIAS:
+        return "mensal"
+    if dias >= ROLLUP_SEMANAL_DIAS:
+        return "semanal"
+    return None
+
+def calcular_variacao(scores):
+    """Variação percentual do último score em relação ao penúltimo (0 se não houver dois)"""
+    if len(scores) < 2 or scores[-2] == 0:
+        return 0
+    return ((scores[-1] - scores[-2]) / scores[-2]) * 100
+
+def calcular_tendencia(variacao):
+    return 'up' if variacao > 0 else 'down' if variacao < 0 else 'stable'
+
+def calcular_estado(categoria, pontos, subscription_id=None):
+    """
+    Monta a entidade de estado atual da categoria a partir dos pontos conhecidos
+    
+    Args:
+        categoria (str): Categoria do Advisor
+        pontos (dict): data (RowKey) -> score, incluindo ao menos os PONTOS_ESTADO mais recentes
+        subscription_id (str): Subscription dos pontos
+    
+    Returns:
+        dict: Entidade com score atual e anterior, variação, tendência e os últimos pontos
+    """
+    recentes = [[data, pontos[data]] for data in sorted(pontos)[-PONTOS_ESTADO:]]
+    scores = [round(score) for _, score in recentes]
+    variacao = calcular_variacao(scores)
+
+    return {
+        "PartitionKey": chave_particao(PARTICAO_ESTADO, subscription_id),
+        "RowKey": categoria,
+        "Score": recentes[-1][1],
+        "ScoreAnterior": recentes[-2][1] if len(recentes) >= 2 else None,
+        "UltimaData": recentes[-1][0],
+        "Variacao": variacao,
+        "Tendencia": calcular_tendencia(variacao),
+        "Pontos": json.dumps(recentes)
+    }
+
+def consultar_estados(table_client, subscription_id=None):
+    """Lê em uma única consulta o estado atual de todas as categorias da subscription"""
+    entidades = table_client.query_entities(
+        "PartitionKey eq @particao",
+        parameters={"particao": chave_particao(PARTICAO_ESTADO, subscription_id)}
+    )
+    return {e["RowKey"]: e for e in entidades}
+
+def _consultar_particao(table_client, partition_key, data_inicio, data_fim=None):
+    filtro = "PartitionKey eq @particao"
+    parametros = {"particao": partition_key}
+
+    # O RowKey é a data ISO do score, então a comparação de strings filtra por período
+    if data_inicio:
+        filtro += " and RowKey ge @data_inicio"
+        parametros["data_inicio"] = data_inicio
+    if data_fim:
+        filtro += " and RowKey lt @data_fim"
+        parametros["data_fim"] = data_fim
+
+    entidades = table_client.query_entities(filtro, parameters=parametros, select=COLUNAS_HISTORICO)
+    return sorted(entidades, key=lambda x: x["RowKey"])
+
+def _media_por_data(categoria, series):
+    """
+    Consolida as séries de várias subscriptions pela média do score em cada data
+    
+    Uma subscription sem registro em uma data entra na média com o seu último score
+    anterior, para que um dia sem registro não desloque a linha consolidada. Antes do
+    primeiro registro (subscription adicionada depois) ela fica fora da média
+    """
+    if len(series) == 1:
+        return series[0]
+
+    por_serie = [{e["RowKey"]: e["Score"] for e in entidades} for entidades in series]
+    ultimos = [None] * len(por_serie)
+
+    consolidado = []
+    for row_key in sorted(set().union(*por_serie)):
+        for indice, scores in enumerate(por_serie):
+            if row_key in scores:
+                ultimos[indice] = scores[row_key]
+        presentes = [score for score in ultimos if score is not None]
+        consolidado.append({"PartitionKey": categoria, "RowKey": row_key, "Score": sum(presentes) / len(presentes)})
+    return consolidado
+
+def carregar_historico_scores(categorias=CATEGORIAS, dias=JANELA_HISTORICO_DIAS, subscriptions=None, usar_rollups=True):
+    """
+    Carrega o histórico de scores de todas as categorias de uma só vez
+    As partições são consultadas em paralelo e o resultado é compartilhado pelos gráficos
+    
+    Args:
+        categorias (list): Categorias a carregar
+        dias (int): Quantidade de dias de histórico; 0 carrega todo o histórico
+        subscriptions (list): Subscriptions a carregar; com mais de uma, o score de
+            cada data é a média entre elas. Sem valor, usa a subscription original
+        usar_rollups (bool): Se False, lê sempre a série diária
+    
+    Returns:
+        dict: categoria -> lista de entidades ordenadas por RowKey (data)
+        Janelas longas (ver nivel_rollup) retornam um ponto por semana ou mês
+    """
+    data_inicio = None
+    if dias:
+        data_inicio = (datetime.now(timezone.utc) - timedelta(days=dias)).strftime("%Y-%m-%d")
+
+    # Janelas longas leem o rollup, com tamanho fixo, em vez de todas as linhas diárias
+    nivel = nivel_rollup(dias) if usar_rollups else None
+
+    def consultar(subscription_id, categoria):
+        partition_key = chave_particao(categoria, subscription_id)
+        if not nivel:
+            return _consultar_particao(table_client, partition_key, data_inicio)
+
+        inicio = inicio_periodo(data_inicio, nivel)
+        entidades = _consultar_particao(table_client, chave_particao_rollup(partition_key, nivel), inicio)
+        if entidades and entidades[0]["RowKey"] <= inicio:
+            return entidades
+
+        # Os períodos anteriores ao primeiro rollup gravado (linhas diárias gravadas antes
+        # dos rollups existirem) são calculados aqui a partir da série diária
+        fim = entidades[0]["RowKey"] if entidades else None
+        diarias = _consultar_particao(table_client, partition_key, inicio, fim)
+        if diarias:
+            logging.warning(
+                f"Rollup {nivel} de {partition_key} incompleto; {len(diarias)} linha(s) diária(s) agregada(s) "
+                "na leitura. Execute registroScores?rollups=reconstruir para gravá-las."
+            )
+            pontos = {e["RowKey"]: e["Score"] for e in diarias}
+            entidades = calcular_rollups(partition_key, pontos, pontos, niveis=[nivel]) + entidades
+        return entidades
+
+    consultas = [(sub, categoria) for sub in (subscriptions or [None]) for categoria in categorias]
+
+    table_client = obter_table_client()
+    with ThreadPoolExecutor(max_workers=min(HISTORICO_MAX_WORKERS, len(consultas))) as executor:
+        resultados = executor.map(
+            lambda consulta: consultar(*consulta),
+            consultas
+        )
+
+        series_por_categoria = {categoria: [] for categoria in categorias}
+        for (_, categoria), entidades in zip(consultas, resultados):
+            series_por_categoria[categoria].append(entidades)
+
+    return {categoria: _media_por_data(categoria, series) for categoria, series in series_por_categoria.items()}
+
+def carregar_estado_scores(categorias=CATEGORIAS, subscriptions=None):
+    """
+    Carrega o estado atual das categorias gravado pelo registroScores, com uma
+    consulta por subscription em vez da leitura do histórico completo
+    
+    Args:
+        categorias (list): Categorias a carregar
+        subscriptions (list): Subscriptions a carregar; com mais de uma, os pontos
+            são consolidados pela média e a variação é recalculada
+    
+    Returns:
+        dict: categoria -> (entidades ordenadas por RowKey, variação percentual);
+        categorias sem estado gravado ficam de fora
+    """
+    subscriptions = subscriptions or [None]
+
+    table_client = obter_table_client()
+    with ThreadPoolExecutor(max_workers=min(HISTORICO_MAX_WORKERS, len(subscriptions))) as executor:
+        estados = list(executor.map(lambda sub: consultar_estados(table_client, sub), subscriptions))
+
+    resultado = {}
+    for categoria in categorias:
+        encontrados = [estado[categoria] for estado in estados if categoria in estado]
+        if not encontrados:
+            continue
+
+        series = [
+            [{"PartitionKey": categoria, "RowKey": data, "Score": score} for data, score in json.loads(e["Pontos"])]
+            for e in encontrados
+        ]
+        entidades = _media_por_data(categoria, series)
+
+        if len(encontrados) == 1:
+            variacao = encontrados[0]["Variacao"]
+        else:
+            variacao = calcular_variacao([round(e["Score"]) for e in entidades])
+        resultado[categoria] = (entidades, variacao)
+
+    return resultado
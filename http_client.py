@@ -0,0 +1,52 @@
+import os
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Configuração do pool de conexões e das novas tentativas
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "8"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "16"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "4"))
+HTTP_BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", "0.5"))
+
+# Timeout padrão (conexão, leitura) em segundos
+HTTP_TIMEOUT = (
+    float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")),
+    float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+)
+
+def _criar_sessao():
+    """
+    Cria a sessão HTTP compartilhada
+    Mantém as conexões abertas (keep-alive) com um pool por host e repete as chamadas
+    com backoff exponencial em caso de throttling (429) ou falhas temporárias (5xx),
+    respeitando o cabeçalho Retry-After
+    """
+    retry = Retry(
+        total=HTTP_MAX_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        status_forcelist=(429, 500, 502, 503, 504),
+        # As chamadas POST deste projeto são consultas (token, Resource Graph, Log Analytics)
+        allowed_methods=frozenset(["GET", "POST"]),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    return session
+
+# Sessão compartilhada entre as invocações do mesmo worker
+session = _criar_sessao()
+
+def get(url, **kwargs):
+    kwargs.setdefault("timeout", HTTP_TIMEOUT)
+    return session.get(url, **kwargs)
+
+def post(url, **kwargs):
+    kwargs.setdefault("timeout", HTTP_TIMEOUT)
+    return session.post(url, **kwargs)
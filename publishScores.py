@@ -1,92 +1,189 @@
 from function_app import app
 import azure.functions as func
 import logging
-import os
-import requests
+import http_client
 
-from azure.data.tables import TableClient
-from azure.identity import ClientSecretCredential
-from azure.core.exceptions import ResourceNotFoundError
+from azure_auth import get_token, ARM_RESOURCE
+import json
+from historico_scores import obter_table_client, calcular_rollups, inicio_janela_rollups, calcular_estado, consultar_estados
+from subscriptions import listar_subscriptions, chave_particao, executar_por_subscription
 
 
 # Variáveis de ambiente
-TENANT_ID = os.getenv("TENANT_ID")
-CLIENT_ID = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
-SUBSCRIPTION_ID = os.getenv("SUBSCRIPTION_ID")
 # STORAGE_ACCOUNT_NAME = "storagescores"
 # TABLE_NAME = "AdvisorScores"
 
 
-# Endpoint para obeter o token
-TOKEN_URL = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/token"
-
 # Função para obter o token de acesso
 def get_access_token():
-    payload = {
-        'grant_type': 'client_credentials',
-        'client_id': CLIENT_ID,
-        'client_secret': CLIENT_SECRET,
-        'resource': 'https://management.azure.com/'
-    }
-    response = requests.post(TOKEN_URL, data=payload)
-    response.raise_for_status()
-    return response.json()['access_token']
+    return get_token(ARM_RESOURCE)
 
-# Função para obter a pontuação do Azure Advisor
-def get_advisor_score(token, category):
-    url = f"https://management.azure.com/subscriptions/{SUBSCRIPTION_ID}/providers/Microsoft.Advisor/advisorScore/{category}?api-version=2025-01-01"
-    headers = {'Authorization': f'Bearer {token}'}
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    data = response.json()
+ADVISOR_CATEGORIES = ["Cost", "HighAvailability", "OperationalExcellence", "Performance", "Security"]
+
+# Função para extrair o último score de uma categoria da resposta do Azure Advisor
+def extrair_ultimo_score(item):
     try:
-        
-        score_data = data["properties"]["lastRefreshedScore"]
+        score_data = item["properties"]["lastRefreshedScore"]
         return {
                 "score": round(score_data["score"], 2),
                 "date": score_data["date"]
         }
-    except (KeyError, IndexError):
+    except (KeyError, IndexError, TypeError):
         return {
             "score": None,
             "date": None
         }
 
-def get_scores(token):
-    advisor_categories = ["Cost", "HighAvailability", "OperationalExcellence", "Performance", "Security"]
-    return {cat: get_advisor_score(token, cat) for cat in advisor_categories}
-
-
+# Função para extrair a série diária de scores retornada junto com o último score
+def extrair_serie_diaria(item):
+    try:
+        series = item["properties"].get("timeSeries") or []
+    except (KeyError, TypeError, AttributeError):
+        return []
 
-def registrar_scores_em_tabela(scores):
-    credential = ClientSecretCredential(
-        tenant_id=TENANT_ID,
-        client_id=CLIENT_ID,
-        client_secret=CLIENT_SECRET
-    )
-    table_url = f"https://storagescores.table.core.windows.net"
-    table_client = TableClient(endpoint=table_url, table_name="AdvisorScores", credential=credential)
+    pontos = []
+    for serie in series:
+        if serie.get("aggregationLevel", "").lower() != "day":
+            continue
+        for ponto in serie.get("scoreHistory") or []:
+            if ponto.get("score") is None or not ponto.get("date"):
+                continue
+            pontos.append({
+                "score": round(ponto["score"], 2),
+                "date": ponto["date"]
+            })
+    return pontos
+
+# Função para obter a pontuação do Azure Advisor de todas as categorias
+def get_scores(token, subscription_id):
+    """
+    Obtém os scores de todas as categorias com uma única chamada ao endpoint
+    de coleção advisorScore, em vez de uma chamada por categoria
+    
+    Returns:
+        dict: categoria -> {"score", "date", "historico"}, onde "historico" é a
+        série diária de {"score", "date"} retornada pelo Advisor
+    """
+    url = f"https://management.azure.com/subscriptions/{subscription_id}/providers/Microsoft.Advisor/advisorScore?api-version=2025-01-01"
+    headers = {'Authorization': f'Bearer {token}'}
+    response = http_client.get(url, headers=headers)
+    response.raise_for_status()
+    data = response.json()
 
+    itens_por_categoria = {item.get("name"): item for item in data.get("value", [])}
+    scores = {}
+    for cat in ADVISOR_CATEGORIES:
+        item = itens_por_categoria.get(cat)
+        scores[cat] = extrair_ultimo_score(item)
+        scores[cat]["historico"] = extrair_serie_diaria(item)
+    return scores
+
+
+
+# Limite de operações por transação (entity group transaction) do Table Storage
+TAMANHO_MAXIMO_TRANSACAO = 100
+
+def enviar_entidades_em_lote(table_client, entidades):
+    """
+    Grava as entidades com upsert em transações agrupadas por PartitionKey
+    O Table Storage só aceita transações dentro de uma mesma partição,
+    com no máximo TAMANHO_MAXIMO_TRANSACAO operações cada
+    """
+    from azure.data.tables import UpdateMode
+
+    por_particao = {}
+    for entidade in entidades:
+        por_particao.setdefault(entidade["PartitionKey"], []).append(entidade)
+
+    for particao, lista in por_particao.items():
+        for inicio in range(0, len(lista), TAMANHO_MAXIMO_TRANSACAO):
+            lote = lista[inicio:inicio + TAMANHO_MAXIMO_TRANSACAO]
+            operacoes = [("upsert", entidade, {"mode": UpdateMode.MERGE}) for entidade in lote]
+            table_client.submit_transaction(operacoes)
+            logging.info(f"{len(lote)} score(s) registrado(s) para {particao}.")
+
+def _scores_registrados(table_client, partition_key, data_inicio=None):
+    filtro = "PartitionKey eq @particao"
+    parametros = {"particao": partition_key}
+    if data_inicio:
+        filtro += " and RowKey ge @data_inicio"
+        parametros["data_inicio"] = data_inicio
+
+    entidades = table_client.query_entities(filtro, parameters=parametros, select=["RowKey", "Score"])
+    return {e["RowKey"]: e["Score"] for e in entidades}
+
+def registrar_scores_em_tabela(scores, subscription_id=None):
+    """
+    Registra o último score e todos os pontos da série diária que ainda não estão
+    na tabela, recuperando automaticamente os dias em que o registro não rodou
+    As partições de cada subscription são nomeadas por subscriptions.chave_particao
+    
+    Os rollups semanais e mensais dos períodos que receberam datas novas e o
+    estado atual da categoria são atualizados na mesma gravação
+    (ver historico_scores.calcular_rollups e historico_scores.calcular_estado)
+    """
+    table_client = obter_table_client()
+    estados = consultar_estados(table_client, subscription_id)
+
+    entidades = []
     for categoria, dados in scores.items():
-        if not dados["score"] or not dados["date"]:
+        pontos = {}
+        for ponto in dados.get("historico", []):
+            pontos[ponto["date"]] = ponto["score"]
+        if dados["score"] and dados["date"]:
+            pontos[dados["date"]] = dados["score"]
+
+        pontos = {data: score for data, score in pontos.items() if score}
+        if not pontos:
             continue
 
-        row_key = dados["date"]
-        partition_key = categoria
+        partition_key = chave_particao(categoria, subscription_id)
+        # A leitura começa no início do período mais antigo afetado, para recalcular os rollups
+        existentes = _scores_registrados(table_client, partition_key, inicio_janela_rollups(min(pontos)))
+        faltantes = sorted(data for data in pontos if data not in existentes)
+
+        if not faltantes:
+            logging.info(f"Já existe score para {categoria} em todas as datas. Ignorando.")
+            continue
 
-        try:
-            table_client.get_entity(partition_key=partition_key, row_key=row_key)
-            logging.info(f"Já existe score para {categoria} em {row_key}. Ignorando.")
-        except ResourceNotFoundError:
-            entidade = {
+        for row_key in faltantes:
+            entidades.append({
                 "PartitionKey": partition_key,
                 "RowKey": row_key,
-                "Score": dados["score"],
-                "LastRefreshed": dados["date"]
-            }
-            table_client.create_entity(entity=entidade)
-            logging.info(f"Score registrado para {categoria} em {row_key}.")
+                "Score": pontos[row_key],
+                "LastRefreshed": row_key
+            })
+
+        existentes.update({row_key: pontos[row_key] for row_key in faltantes})
+        entidades.extend(calcular_rollups(partition_key, existentes, faltantes))
+
+        # O estado guarda os últimos pontos; combinados aos lidos agora e às datas novas
+        recentes = dict(json.loads(estados[categoria]["Pontos"])) if categoria in estados else {}
+        recentes.update(existentes)
+        entidades.append(calcular_estado(categoria, recentes, subscription_id))
+
+    enviar_entidades_em_lote(table_client, entidades)
+
+def reconstruir_agregados_subscription(subscription_id):
+    """Recalcula todos os rollups e o estado atual a partir da série diária completa de cada categoria"""
+    table_client = obter_table_client()
+
+    entidades = []
+    for categoria in ADVISOR_CATEGORIES:
+        partition_key = chave_particao(categoria, subscription_id)
+        pontos = _scores_registrados(table_client, partition_key)
+        if not pontos:
+            continue
+        entidades.extend(calcular_rollups(partition_key, pontos, pontos))
+        entidades.append(calcular_estado(categoria, pontos, subscription_id))
+
+    enviar_entidades_em_lote(table_client, entidades)
+    return True
+
+def registrar_scores_subscription(token, subscription_id):
+    scores = get_scores(token, subscription_id)
+    registrar_scores_em_tabela(scores, subscription_id)
+    return True
 
 @app.route(route="registroScores")
 def registroScores(req: func.HttpRequest) -> func.HttpResponse:
@@ -94,7 +191,17 @@ def registroScores(req: func.HttpRequest) -> func.HttpResponse:
 
     
     token = get_access_token()
-    scores = get_scores(token)
-    registrar_scores_em_tabela(scores)
+    subscriptions = listar_subscriptions(token)
+    processadas, _ = executar_por_subscription(registrar_scores_subscription, subscriptions, token)
+
+    # ?rollups=reconstruir recalcula os rollups e o estado atual de todo o histórico já gravado
+    if req.params.get("rollups") == "reconstruir":
+        processadas, _ = executar_por_subscription(reconstruir_agregados_subscription, list(processadas))
+
+    if len(processadas) < len(subscriptions):
+        return func.HttpResponse(
+            f"Scores registrados para {len(processadas)} de {len(subscriptions)} subscriptions.",
+            status_code=500
+        )
 
     return func.HttpResponse("Scores processados e registrados com sucesso.", status_code=200)
\ No newline at end of file
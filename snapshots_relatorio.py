@@ -0,0 +1,90 @@
+import os
+import threading
+from azure_auth import CachedTokenCredential
+
+# Container onde ficam os relatórios pré-gerados pelo timer
+SNAPSHOT_URL = "https://storagescores.blob.core.windows.net"
+SNAPSHOT_CONTAINER = os.getenv("REPORT_SNAPSHOT_CONTAINER", "relatorios")
+
+# Nome do snapshot consolidado; os de uma única subscription usam PREFIXO_SUBSCRIPTION
+SNAPSHOT_CONSOLIDADO = "relatorio.html"
+PREFIXO_SUBSCRIPTION = "relatorio-"
+
+# Cliente compartilhado entre as invocações do mesmo worker
+_container_client = None
+_container_client_lock = threading.Lock()
+
+def obter_container_client():
+    """Retorna o ContainerClient compartilhado do container de snapshots"""
+    global _container_client
+    if _container_client is None:
+        with _container_client_lock:
+            if _container_client is None:
+                from azure.storage.blob import ContainerClient
+                _container_client = ContainerClient(SNAPSHOT_URL, SNAPSHOT_CONTAINER, credential=CachedTokenCredential())
+    return _container_client
+
+def nome_snapshot(subscription=None):
+    """Retorna o nome do blob do relatório consolidado ou de uma única subscription"""
+    if not subscription:
+        return SNAPSHOT_CONSOLIDADO
+    return f"{PREFIXO_SUBSCRIPTION}{subscription}.html"
+
+def salvar_snapshot(html, subscription=None):
+    """
+    Grava o relatório renderizado, substituindo o snapshot anterior
+
+    Returns:
+        dict: {"html", "etag", "last_modified"} do snapshot gravado
+    """
+    from azure.storage.blob import ContentSettings
+
+    resultado = obter_container_client().upload_blob(
+        nome_snapshot(subscription),
+        html.encode("utf-8"),
+        overwrite=True,
+        content_settings=ContentSettings(content_type="text/html; charset=utf-8")
+    )
+    return {"html": html, "etag": resultado["etag"], "last_modified": resultado["last_modified"]}
+
+def ler_snapshot(subscription=None, etag=None):
+    """
+    Lê o snapshot do relatório
+
+    Args:
+        subscription (str): Subscription do relatório; sem valor, lê o consolidado
+        etag (str): ETag já conhecido pelo cliente (If-None-Match)
+
+    Returns:
+        dict: {"html", "etag", "last_modified"}; "html" é None quando o snapshot
+        ainda corresponde ao etag informado. None se o snapshot não existir
+    """
+    from azure.core.exceptions import ResourceNotFoundError
+
+    # As propriedades são lidas antes, para que a idade do snapshot seja conhecida
+    # mesmo quando o cliente já tem a versão atual
+    blob_client = obter_container_client().get_blob_client(nome_snapshot(subscription))
+    try:
+        propriedades = blob_client.get_blob_properties()
+        if etag and etag == propriedades.etag:
+            return {"html": None, "etag": etag, "last_modified": propriedades.last_modified}
+        download = blob_client.download_blob(encoding="utf-8")
+    except ResourceNotFoundError:
+        return None
+
+    return {
+        "html": download.readall(),
+        "etag": download.properties.etag,
+        "last_modified": download.properties.last_modified
+    }
+
+def listar_snapshots_subscriptions():
+    """Retorna as subscriptions que já têm um snapshot próprio"""
+    return [
+        blob.name[len(PREFIXO_SUBSCRIPTION):-len(".html")]
+        for blob in obter_container_client().list_blobs(name_starts_with=PREFIXO_SUBSCRIPTION)
+    ]
+
+def excluir_snapshot(subscription):
+    """Exclui o snapshot de uma subscription que saiu do escopo do relatório"""
+    obter_container_client().delete_blob(nome_snapshot(subscription))
@@ -0,0 +1,116 @@
+import struct
+import zlib
+import numpy as np
+
+# Dimensões padrão, equivalentes ao mini-gráfico de 2.5 x 1.2 polegadas a 80 dpi
+LARGURA_PADRAO = 200
+ALTURA_PADRAO = 96
+
+# Aparência da linha e da área preenchida
+ESPESSURA_LINHA = 2.2      # 2 pt a 80 dpi
+OPACIDADE_LINHA = 0.8
+OPACIDADE_AREA = 0.1
+
+# Margem horizontal (fração da largura) e vertical (pontos de score)
+MARGEM_X = 0.05
+MARGEM_Y = 2
+
+def _coordenadas(scores, x_values, largura, altura):
+    """Converte a série para coordenadas em pixels (origem no canto superior esquerdo)"""
+    y = np.asarray(scores, dtype=float)
+    x = np.arange(len(y), dtype=float) if x_values is None else np.asarray(x_values, dtype=float)
+
+    x_min, x_max = x.min(), x.max()
+    if x_max == x_min:
+        x_min, x_max = x_min - 1, x_max + 1
+    margem = (x_max - x_min) * MARGEM_X
+    x_min, x_max = x_min - margem, x_max + margem
+
+    y_min, y_max = y.min() - MARGEM_Y, y.max() + MARGEM_Y
+
+    px = (x - x_min) / (x_max - x_min) * largura
+    py = (y_max - y) / (y_max - y_min) * altura
+    return px, py
+
+def gerar_sparkline_svg(scores, cor, x_values=None, largura=LARGURA_PADRAO, altura=ALTURA_PADRAO):
+    """
+    Gera o mini-gráfico (linha com área preenchida, sem eixos) como SVG
+    
+    Args:
+        scores (list): Valores da série
+        cor (str): Cor em hexadecimal (#RRGGBB)
+        x_values (list): Posições no eixo X (ex.: timestamps); por padrão, os índices
+    
+    Returns:
+        str: Documento SVG
+    """
+    px, py = _coordenadas(scores, x_values, largura, altura)
+    pontos = " ".join(f"{x:.1f},{y:.1f}" for x, y in zip(px, py))
+    linha = f"M{pontos}"
+    area = f"M{px[0]:.1f},{altura} L{pontos} L{px[-1]:.1f},{altura} Z"
+
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{largura}" height="{altura}" viewBox="0 0 {largura} {altura}">'
+        f'<path d="{area}" fill="{cor}" fill-opacity="{OPACIDADE_AREA}"/>'
+        f'<path d="{linha}" fill="none" stroke="{cor}" stroke-opacity="{OPACIDADE_LINHA}" '
+        f'stroke-width="{ESPESSURA_LINHA}" stroke-linejoin="round" stroke-linecap="round"/>'
+        f'</svg>'
+    )
+
+def _chunk_png(tipo, dados):
+    return struct.pack(">I", len(dados)) + tipo + dados + struct.pack(">I", zlib.crc32(tipo + dados) & 0xFFFFFFFF)
+
+def _codificar_png(alfa, rgb):
+    """
+    Codifica a imagem como PNG indexado: como a cor é única, a paleta tem 256
+    entradas com a mesma cor e opacidades de 0 a 255, e cada pixel ocupa um byte
+    """
+    altura, largura = alfa.shape
+    # Cada linha do PNG começa com o byte do filtro (0 = nenhum)
+    linhas = np.concatenate([np.zeros((altura, 1), dtype=np.uint8), alfa], axis=1)
+    cabecalho = struct.pack(">IIBBBBB", largura, altura, 8, 3, 0, 0, 0)
+    paleta = bytes(rgb) * 256
+    transparencia = bytes(range(256))
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _chunk_png(b"IHDR", cabecalho)
+        + _chunk_png(b"PLTE", paleta)
+        + _chunk_png(b"tRNS", transparencia)
+        + _chunk_png(b"IDAT", zlib.compress(linhas.tobytes(), 6))
+        + _chunk_png(b"IEND", b"")
+    )
+
+def gerar_sparkline_png(scores, cor, x_values=None, largura=LARGURA_PADRAO, altura=ALTURA_PADRAO):
+    """
+    Gera o mini-gráfico como PNG com fundo transparente, sem matplotlib
+    Usado nos e-mails, já que boa parte dos clientes de e-mail não exibe SVG
+    
+    Args:
+        scores (list): Valores da série
+        cor (str): Cor em hexadecimal (#RRGGBB)
+        x_values (list): Posições no eixo X (ex.: timestamps); por padrão, os índices
+    
+    Returns:
+        bytes: Imagem PNG
+    """
+    px, py = _coordenadas(scores, x_values, largura, altura)
+
+    # Altura da linha no centro de cada coluna de pixels e sua inclinação
+    centros_x = np.arange(largura) + 0.5
+    linha_y = np.interp(centros_x, px, py)
+    inclinacao = np.gradient(linha_y)
+    meia_espessura = ESPESSURA_LINHA / 2 * np.sqrt(1 + inclinacao ** 2)
+
+    # Fora do intervalo da série não há linha nem área
+    dentro = (centros_x >= px.min()) & (centros_x <= px.max())
+
+    centros_y = (np.arange(altura) + 0.5)[:, None]
+    distancia = np.abs(centros_y - linha_y[None, :])
+    cobertura_linha = np.clip(meia_espessura[None, :] + 0.5 - distancia, 0, 1) * dentro
+    cobertura_area = np.clip(centros_y - linha_y[None, :] + 0.5, 0, 1) * dentro
+
+    alfa_linha = cobertura_linha * OPACIDADE_LINHA
+    alfa = alfa_linha + cobertura_area * OPACIDADE_AREA * (1 - alfa_linha)
+
+    rgb = [int(cor.lstrip("#")[i:i + 2], 16) for i in (0, 2, 4)]
+    return _codificar_png(np.round(alfa * 255).astype(np.uint8), rgb)
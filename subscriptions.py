@@ -0,0 +1,90 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+import http_client
+
+# Variáveis de Ambiente
+# SUBSCRIPTION_ID é a subscription original; SUBSCRIPTION_IDS (separadas por vírgula)
+# ou MANAGEMENT_GROUP_ID ampliam o relatório para várias subscriptions
+SUBSCRIPTION_ID = os.getenv("SUBSCRIPTION_ID")
+SUBSCRIPTION_IDS = [s.strip() for s in os.getenv("SUBSCRIPTION_IDS", "").split(",") if s.strip()]
+MANAGEMENT_GROUP_ID = os.getenv("MANAGEMENT_GROUP_ID")
+
+# Número máximo de subscriptions processadas ao mesmo tempo
+SUBSCRIPTION_MAX_WORKERS = int(os.getenv("SUBSCRIPTION_MAX_WORKERS", "4"))
+
+RESOURCE_GRAPH_URL = "https://management.azure.com/providers/Microsoft.ResourceGraph/resources?api-version=2021-03-01"
+
+def _subscriptions_do_management_group(token, management_group_id):
+    headers = {
+        'Authorization': f'Bearer {token}',
+        'Content-Type': 'application/json'
+    }
+    body = {
+        "query": "resourcecontainers | where type =~ 'microsoft.resources/subscriptions' | project subscriptionId | order by subscriptionId asc",
+        "managementGroups": [management_group_id],
+        "options": {"resultFormat": "objectArray"}
+    }
+
+    subscriptions = []
+    while True:
+        response = http_client.post(RESOURCE_GRAPH_URL, headers=headers, json=body)
+        response.raise_for_status()
+        result = response.json()
+        subscriptions.extend(item["subscriptionId"] for item in result.get("data", []))
+
+        skip_token = result.get("$skipToken")
+        if not skip_token:
+            return subscriptions
+        body["options"]["$skipToken"] = skip_token
+
+def listar_subscriptions(token):
+    """
+    Retorna as subscriptions incluídas no relatório
+    Prioridade: MANAGEMENT_GROUP_ID, depois SUBSCRIPTION_IDS e por fim SUBSCRIPTION_ID
+    
+    Returns:
+        list: IDs das subscriptions
+    """
+    if MANAGEMENT_GROUP_ID:
+        return _subscriptions_do_management_group(token, MANAGEMENT_GROUP_ID)
+    if SUBSCRIPTION_IDS:
+        return SUBSCRIPTION_IDS
+    return [SUBSCRIPTION_ID]
+
+def chave_particao(categoria, subscription_id=None):
+    """
+    Retorna a PartitionKey da tabela AdvisorScores para a categoria da subscription
+    A subscription original (SUBSCRIPTION_ID) mantém as partições já existentes,
+    nomeadas apenas com a categoria
+    """
+    if not subscription_id or subscription_id == SUBSCRIPTION_ID:
+        return categoria
+    return f"{subscription_id}_{categoria}"
+
+def executar_por_subscription(funcao, subscriptions, *args):
+    """
+    Executa a função para cada subscription em paralelo, limitado a SUBSCRIPTION_MAX_WORKERS
+    Subscriptions com erro são registradas no log e retornadas à parte
+    
+    Args:
+        funcao (callable): Função chamada como funcao(*args, subscription_id)
+        subscriptions (list): IDs das subscriptions
+    
+    Returns:
+        tuple: (dict subscription_id -> resultado das que concluíram,
+        lista das subscriptions com erro)
+    """
+    def executar(subscription_id):
+        try:
+            return funcao(*args, subscription_id)
+        except Exception as e:
+            logging.error(f"Erro ao processar a subscription {subscription_id}: {e}")
+            return None
+
+    max_workers = max(1, min(SUBSCRIPTION_MAX_WORKERS, len(subscriptions)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        resultados = dict(zip(subscriptions, executor.map(executar, subscriptions)))
+
+    falhas = [sub for sub, resultado in resultados.items() if resultado is None]
+    return {sub: resultado for sub, resultado in resultados.items() if resultado is not None}, falhas
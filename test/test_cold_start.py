@@ -0,0 +1,11 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cold_start_budget
+
+
+def test_cold_start_dentro_do_orcamento():
+    """O import do function_app cabe no orçamento e não carrega módulos pesados"""
+    assert cold_start_budget.main() == 0
@@ -0,0 +1,31 @@
+import os
+import sys
+import warnings
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datas import ParserDatas
+
+
+def test_coluna_e_linha_a_linha_descartam_o_fuso_da_mesma_forma():
+    valores = ["2025-09-25T10:00:00-03:00", "2025-09-26T10:00:00+00:00", "2025-09-27T10:00:00Z"]
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        datas, invalidas = ParserDatas().converter_coluna(valores)
+
+    assert invalidas == []
+    assert datas == [ParserDatas().converter(v) for v in valores]
+    assert datas[0] == datetime(2025, 9, 25, 10, 0, 0)
+
+
+def test_coluna_sem_fuso_usa_a_conversao_vetorizada():
+    datas, invalidas = ParserDatas().converter_coluna(["2025-09-25T00:00:00Z", "2025-09-26"])
+    assert invalidas == []
+    assert datas == [datetime(2025, 9, 25), datetime(2025, 9, 26)]
+
+
+def test_coluna_informa_linhas_nao_reconhecidas():
+    datas, invalidas = ParserDatas().converter_coluna(["25/09/2025", "ontem"])
+    assert datas[0] == datetime(2025, 9, 25)
+    assert invalidas == [1]
@@ -0,0 +1,86 @@
+import json
+import os
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import historico_scores
+from historico_scores import calcular_estado, calcular_rollups, carregar_historico_scores, inicio_janela_rollups
+
+
+class TableClientFalso:
+    """TableClient em memória com os filtros usados pelo historico_scores"""
+
+    def __init__(self, entidades=()):
+        self.entidades = {}
+        self.gravar(entidades)
+
+    def gravar(self, entidades):
+        for entidade in entidades:
+            self.entidades[(entidade["PartitionKey"], entidade["RowKey"])] = dict(entidade)
+
+    def query_entities(self, filtro, parameters=None, select=None):
+        return [
+            dict(e) for (particao, row_key), e in self.entidades.items()
+            if particao == parameters["particao"]
+            and row_key >= parameters.get("data_inicio", "")
+            and ("data_fim" not in parameters or row_key < parameters["data_fim"])
+        ]
+
+
+def serie_diaria(dias, categoria="Cost"):
+    hoje = date.today()
+    return [
+        {"PartitionKey": categoria, "RowKey": (hoje - timedelta(days=dias - 1 - i)).isoformat(), "Score": 50 + i % 10}
+        for i in range(dias)
+    ]
+
+
+def test_calcular_rollups_recalcula_apenas_os_periodos_afetados():
+    pontos = {"2025-02-28": 50, "2025-03-01": 60, "2025-03-03": 70}
+    entidades = calcular_rollups("Cost", pontos, ["2025-03-03"])
+
+    por_chave = {(e["PartitionKey"], e["RowKey"]): e for e in entidades}
+    assert set(por_chave) == {("Cost_semanal", "2025-03-03"), ("Cost_mensal", "2025-03-01")}
+    mensal = por_chave[("Cost_mensal", "2025-03-01")]
+    assert (mensal["Score"], mensal["Min"], mensal["Max"], mensal["Mean"], mensal["Count"]) == (70, 60, 70, 65.0, 2)
+
+
+def test_calcular_estado_guarda_variacao_sem_arredondar():
+    pontos = {"2025-03-0%d" % dia: score for dia, score in [(1, 80), (2, 82), (3, 84)]}
+    estado = calcular_estado("Cost", pontos)
+
+    assert (estado["PartitionKey"], estado["RowKey"]) == ("EstadoAtual", "Cost")
+    assert (estado["Score"], estado["ScoreAnterior"], estado["UltimaData"]) == (84, 82, "2025-03-03")
+    assert estado["Variacao"] == (84 - 82) / 82 * 100
+    assert estado["Tendencia"] == "up"
+    assert json.loads(estado["Pontos"])[-1] == ["2025-03-03", 84]
+
+
+def test_rollup_parcial_completa_os_periodos_antigos_com_a_serie_diaria(monkeypatch):
+    # Um ano de linhas diárias gravadas antes dos rollups e uma única gravação depois
+    diarias = serie_diaria(365)
+    tabela = TableClientFalso(diarias)
+    novas = [e["RowKey"] for e in diarias[-3:]]
+    pontos = {e["RowKey"]: e["Score"] for e in diarias if e["RowKey"] >= inicio_janela_rollups(novas[0])}
+    tabela.gravar(calcular_rollups("Cost", pontos, novas))
+    monkeypatch.setattr(historico_scores, "obter_table_client", lambda: tabela)
+
+    semanal = carregar_historico_scores(["Cost"], dias=365)["Cost"]
+
+    assert len(semanal) >= 52
+    assert semanal[0]["RowKey"] <= diarias[0]["RowKey"]
+    assert semanal[-1]["RowKey"] == historico_scores.inicio_periodo(diarias[-1]["RowKey"], "semanal")
+    assert [e["RowKey"] for e in semanal] == sorted(e["RowKey"] for e in semanal)
+
+
+def test_sem_rollups_a_serie_e_agregada_na_leitura(monkeypatch):
+    tabela = TableClientFalso(serie_diaria(200))
+    monkeypatch.setattr(historico_scores, "obter_table_client", lambda: tabela)
+
+    semanal = carregar_historico_scores(["Cost"], dias=365)["Cost"]
+    diaria = carregar_historico_scores(["Cost"], dias=0)["Cost"]
+
+    assert 28 <= len(semanal) <= 30
+    assert len(diaria) == 200
@@ -0,0 +1,40 @@
+from bisect import bisect_left
+
+# Faixas de vencimento exibidas no relatório: (título, menor prazo, maior prazo) em dias
+# Um menor prazo None indica uma faixa sem limite inferior
+FAIXAS_VENCIMENTO = [
+    ("Vencidos", None, -1),
+    ("Expira em 0–30 dias", 0, 30),
+    ("Expira em 31–60 dias", 31, 60),
+    ("Expira em 61–90 dias", 61, 90),
+]
+
+def agrupar_por_vencimento(itens, faixas=FAIXAS_VENCIMENTO, campo="DaysToExpire"):
+    """
+    Distribui os itens nas faixas de vencimento em uma única passada
+    Cada item é localizado por busca binária nos limites das faixas; itens fora
+    de todas as faixas são descartados
+    
+    Args:
+        itens (list): Itens com o campo de dias até o vencimento
+        faixas (list): (título, menor prazo, maior prazo), em ordem crescente de prazo
+        campo (str): Nome do campo com os dias até o vencimento
+    
+    Returns:
+        list: (título, itens da faixa ordenados por prazo) para cada faixa
+    """
+    limites_superiores = [maior for _, _, maior in faixas]
+    grupos = [[] for _ in faixas]
+
+    # Os itens normalmente já chegam ordenados do Log Analytics, o que torna a ordenação linear
+    for item in sorted(itens, key=lambda i: i[campo]):
+        dias = item[campo]
+        indice = bisect_left(limites_superiores, dias)
+        if indice == len(faixas):
+            continue
+
+        menor = faixas[indice][1]
+        if menor is None or dias >= menor:
+            grupos[indice].append(item)
+
+    return [(titulo, grupo) for (titulo, _, _), grupo in zip(faixas, grupos)]